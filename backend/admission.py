@@ -0,0 +1,215 @@
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import math
+import os
+import time
+from collections import defaultdict
+
+from metrics import ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTIONS
+
+logger = logging.getLogger(__name__)
+
+# Lower numbers are admitted first and may use the reserved capacity
+HIGH_PRIORITY = 0
+LOW_PRIORITY = 1
+
+# Per-endpoint limits. "expected" seeds the service time estimate (seconds)
+# until real requests have been measured. Keep queue * expected / limit within
+# max_wait, or the queue is shed on its wait estimate before it can fill.
+# Batches are not queued at all: one would wait far longer than max_wait.
+DEFAULT_POLICIES = {
+    "/validate_idea": {"priority": HIGH_PRIORITY, "limit": 32, "queue": 64, "max_wait": 10, "expected": 3},
+    "/validate_audio": {"priority": HIGH_PRIORITY, "limit": 8, "queue": 16, "max_wait": 15, "expected": 6},
+    "/market_analysis": {"priority": LOW_PRIORITY, "limit": 4, "queue": 4, "max_wait": 20, "expected": 15},
+    "/generate_mvp": {"priority": LOW_PRIORITY, "limit": 4, "queue": 8, "max_wait": 20, "expected": 10},
+    "/investor_recommendations": {"priority": LOW_PRIORITY, "limit": 4, "queue": 8, "max_wait": 20, "expected": 8},
+    "/validate_batch": {"priority": LOW_PRIORITY, "limit": 2, "queue": 0, "max_wait": 5, "expected": 60},
+}
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed instead of queued"""
+
+    def __init__(self, endpoint, reason, retry_after):
+        super().__init__(f"{endpoint} is overloaded ({reason})")
+        self.endpoint = endpoint
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def load_policies():
+    """Built-in policies with overrides from the ADMISSION_LIMITS JSON object"""
+    policies = {path: dict(policy) for path, policy in DEFAULT_POLICIES.items()}
+    overrides = os.getenv("ADMISSION_LIMITS")
+    if overrides:
+        for path, override in json.loads(overrides).items():
+            policies[path] = {**policies.get(path, DEFAULT_POLICIES["/generate_mvp"]), **override}
+    for path, policy in policies.items():
+        if policy["queue"] * policy.get("expected", 1) / policy["limit"] > policy["max_wait"]:
+            logger.warning("Admission queue for %s cannot fill within max_wait %ss", path, policy["max_wait"])
+    return policies
+
+
+class AdmissionController:
+    """Per-endpoint concurrency limits with bounded priority queues and load shedding.
+
+    A request runs once its endpoint is under its limit and the process is
+    under ``max_in_flight``; low-priority endpoints may only use
+    ``max_in_flight - reserved`` of that, keeping room for cheap requests.
+    Otherwise it waits in a queue ordered by priority, unless the queue is
+    full or the estimated wait exceeds the endpoint's max_wait, in which case
+    it is rejected at once.
+    """
+
+    def __init__(self, policies, max_in_flight=48, reserved=16):
+        self.policies = policies
+        self.max_in_flight = max_in_flight
+        self.reserved = reserved
+        self.in_flight = defaultdict(int)
+        self.total = 0
+        self.queued = defaultdict(int)
+        self.service_time = {path: policy.get("expected", 1) for path, policy in policies.items()}
+        self._waiters = []
+        self._order = itertools.count()
+
+    def estimated_wait(self, endpoint):
+        """Seconds until a newly queued request would start, from the recent service time.
+
+        The request starts once everything ahead of it, running or queued, has
+        made room; slots free up at ``limit`` requests per service time.
+        """
+        limit = self.policies[endpoint]["limit"]
+        ahead = self.in_flight[endpoint] + self.queued[endpoint]
+        completions = max(1, ahead - limit + 1)
+        return self.service_time[endpoint] * completions / limit
+
+    def _fits(self, endpoint):
+        policy = self.policies[endpoint]
+        capacity = self.max_in_flight if policy["priority"] == HIGH_PRIORITY else self.max_in_flight - self.reserved
+        return self.in_flight[endpoint] < policy["limit"] and self.total < capacity
+
+    def _start(self, endpoint):
+        self.in_flight[endpoint] += 1
+        self.total += 1
+
+    def _finish(self, endpoint, elapsed):
+        self.in_flight[endpoint] -= 1
+        self.total -= 1
+        if elapsed is not None:
+            # Exponentially weighted, so the estimate follows upstream slowdowns
+            self.service_time[endpoint] = 0.8 * self.service_time[endpoint] + 0.2 * elapsed
+        self._dispatch()
+
+    def _dispatch(self):
+        """Admit queued requests, highest priority first, while capacity allows"""
+        remaining = []
+        while self._waiters:
+            waiter = heapq.heappop(self._waiters)
+            _, _, endpoint, future = waiter
+            if future.done():
+                continue
+            if self._fits(endpoint):
+                self._start(endpoint)
+                self._dequeue(endpoint)
+                future.set_result(None)
+            else:
+                remaining.append(waiter)
+        for waiter in remaining:
+            heapq.heappush(self._waiters, waiter)
+
+    def _dequeue(self, endpoint):
+        self.queued[endpoint] -= 1
+        ADMISSION_QUEUE_DEPTH.labels(endpoint).set(self.queued[endpoint])
+
+    def _reject(self, endpoint, reason, retry_after):
+        ADMISSION_REJECTIONS.labels(endpoint, reason).inc()
+        logger.warning("Shedding %s request: %s", endpoint, reason)
+        raise Overloaded(endpoint, reason, retry_after)
+
+    async def acquire(self, endpoint):
+        policy = self.policies[endpoint]
+        if not self.queued[endpoint] and self._fits(endpoint):
+            self._start(endpoint)
+            return
+
+        wait = self.estimated_wait(endpoint)
+        if self.queued[endpoint] >= policy["queue"]:
+            self._reject(endpoint, "queue_full", wait)
+        if wait > policy["max_wait"]:
+            self._reject(endpoint, "wait_estimate", wait)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (policy["priority"], next(self._order), endpoint, future))
+        self.queued[endpoint] += 1
+        ADMISSION_QUEUE_DEPTH.labels(endpoint).set(self.queued[endpoint])
+        try:
+            await asyncio.wait_for(asyncio.shield(future), policy["max_wait"])
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done():
+                # Admitted just as we gave up; hand the slot to the next waiter
+                self._finish(endpoint, None)
+            else:
+                future.cancel()
+                self._dequeue(endpoint)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._reject(endpoint, "timeout", self.estimated_wait(endpoint))
+
+    def release(self, endpoint, elapsed):
+        self._finish(endpoint, elapsed)
+
+
+class AdmissionMiddleware:
+    """ASGI middleware holding an admission slot until the response body has been sent"""
+
+    def __init__(self, app, controller):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        endpoint = scope.get("path")
+        if scope["type"] != "http" or endpoint not in self.controller.policies:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.controller.acquire(endpoint)
+        except Overloaded as e:
+            await self.shed(e, send)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(endpoint, time.perf_counter() - start)
+
+    @staticmethod
+    async def shed(error, send):
+        body = json.dumps({"detail": f"Service is busy, please retry later ({error.reason})"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(error.retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def install(app):
+    """Add admission control to an app unless ADMISSION_CONTROL=0"""
+    if os.getenv("ADMISSION_CONTROL", "1") != "1":
+        return None
+    controller = AdmissionController(
+        load_policies(),
+        max_in_flight=int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "48")),
+        reserved=int(os.getenv("ADMISSION_RESERVED", "16")),
+    )
+    app.add_middleware(AdmissionMiddleware, controller=controller)
+    return controller
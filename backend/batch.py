@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def is_rate_limited(error):
+    """True for upstream quota errors (HTTP 429 / RESOURCE_EXHAUSTED)"""
+    return getattr(error, "code", None) == 429 or type(error).__name__ == "ResourceExhausted"
+
+
+class RateLimiter:
+    """Token bucket allowing ``per_minute`` calls, with bursts up to ``burst``.
+
+    ``per_minute=0`` disables spacing. ``pause`` holds every caller back,
+    e.g. after the upstream reports that quota is exhausted.
+    """
+
+    def __init__(self, per_minute=0, burst=None):
+        self.interval = 60 / per_minute if per_minute else 0
+        self.burst = burst or max(1, int(per_minute // 60))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                if not self.interval:
+                    return
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) / self.interval)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) * self.interval)
+
+
+async def run_batch(items, fn, concurrency, limiter=None, retries=3, backoff=2.0):
+    """Apply ``fn`` to every item with at most ``concurrency`` calls in flight.
+
+    Yields ``(index, result, error)`` as each item completes, in completion
+    order. Rate-limited calls are retried with exponential backoff; any other
+    failure is yielded as that item's error without stopping the batch.
+    """
+    pending = iter(enumerate(items))
+    done = asyncio.Queue()
+
+    async def attempt(item):
+        for n in range(retries + 1):
+            if limiter is not None:
+                await limiter.acquire()
+            try:
+                return await fn(item)
+            except Exception as e:
+                if not is_rate_limited(e) or n == retries:
+                    raise
+                delay = backoff * 2 ** n
+                logger.warning("Rate limited, retrying in %.1fs", delay)
+                if limiter is not None:
+                    limiter.pause(delay)
+                else:
+                    await asyncio.sleep(delay)
+
+    async def worker():
+        for index, item in pending:
+            try:
+                await done.put((index, await attempt(item), None))
+            except Exception as e:
+                await done.put((index, None, e))
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, min(concurrency, len(items))))]
+    try:
+        for _ in range(len(items)):
+            yield await done.get()
+    finally:
+        # The client may disconnect mid-batch; stop issuing calls
+        for task in workers:
+            task.cancel()
@@ -0,0 +1,150 @@
+"""A minimal in-memory server speaking the Redis protocol (RESP2).
+
+Implements just the commands ``state.RedisStateBackend`` uses, so the Redis
+state backend can be exercised locally without a Redis install. EVAL does
+not interpret Lua; it runs the scripts the app sends by their text.
+
+    python bench/fake_redis.py --port 6390
+    STATE_BACKEND=redis REDIS_URL=redis://127.0.0.1:6390/0 uvicorn main:app --workers 4
+"""
+import argparse
+import asyncio
+import time
+
+# state.RELEASE_LOCK_SCRIPT
+RELEASE_LOCK_SCRIPT = b"""
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.scripts = {RELEASE_LOCK_SCRIPT.strip(): self.compare_and_delete}
+
+    def _get(self, key):
+        item = self.data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def execute(self, args):
+        command = args[0].upper()
+        if command == b"PING":
+            return "PONG"
+        if command in (b"CLIENT", b"SELECT"):
+            return "OK"
+        if command == b"GET":
+            return self._get(args[1])
+        if command == b"SET":
+            return self.set(args[1], args[2], args[3:])
+        if command == b"DEL":
+            return sum(1 for key in args[1:] if self._get(key) is not None and self.data.pop(key))
+        if command == b"EXISTS":
+            return sum(1 for key in args[1:] if self._get(key) is not None)
+        if command == b"EVAL":
+            script = self.scripts.get(args[1].strip())
+            if script is None:
+                return Exception("ERR fake Redis cannot run this script")
+            numkeys = int(args[2])
+            return script(args[3:3 + numkeys], args[3 + numkeys:])
+        if command == b"FLUSHDB":
+            self.data.clear()
+            return "OK"
+        return Exception(f"ERR unknown command '{command.decode()}'")
+
+    def compare_and_delete(self, keys, argv):
+        if self._get(keys[0]) == argv[0]:
+            del self.data[keys[0]]
+            return 1
+        return 0
+
+    def set(self, key, value, options):
+        expires_at = None
+        nx = xx = False
+        i = 0
+        while i < len(options):
+            option = options[i].upper()
+            if option == b"EX":
+                expires_at = time.monotonic() + int(options[i + 1])
+                i += 1
+            elif option == b"PX":
+                expires_at = time.monotonic() + int(options[i + 1]) / 1000
+                i += 1
+            elif option == b"NX":
+                nx = True
+            elif option == b"XX":
+                xx = True
+            i += 1
+        exists = self._get(key) is not None
+        if (nx and exists) or (xx and not exists):
+            return None
+        self.data[key] = (value, expires_at)
+        return "OK"
+
+
+def encode(reply):
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, Exception):
+        return f"-{reply}\r\n".encode()
+    if isinstance(reply, str):
+        return f"+{reply}\r\n".encode()
+    if isinstance(reply, int):
+        return f":{reply}\r\n".encode()
+    return b"$%d\r\n%s\r\n" % (len(reply), reply)
+
+
+async def read_command(reader):
+    """Read one command sent as a RESP array of bulk strings"""
+    header = await reader.readline()
+    if not header:
+        return None
+    if not header.startswith(b"*"):
+        # Inline command, as sent by telnet or redis-cli for quick checks
+        return header.split()
+    args = []
+    for _ in range(int(header[1:])):
+        length = int((await reader.readline())[1:])
+        args.append((await reader.readexactly(length + 2))[:-2])
+    return args
+
+
+def create_server(store, host, port):
+    async def handle(reader, writer):
+        try:
+            while (args := await read_command(reader)) is not None:
+                if args:
+                    writer.write(encode(store.execute(args)))
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return asyncio.start_server(handle, host, port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for a Redis server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+
+    async def serve():
+        server = await create_server(FakeRedis(), args.host, args.port)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""Local stand-ins for Gemini, SerpAPI and Supabase.
+
+Serves the response shapes main.py expects, with configurable latency, so the
+backend can be benchmarked without network access or API quota:
+
+- ``POST /v1beta/models/{model}:generateContent`` (Gemini REST transport)
+- ``POST /v1beta/models/{model}:streamGenerateContent`` (streamed as a JSON array)
+- ``GET /search`` (SerpAPI ``organic_results``)
+- ``GET /rest/v1/investor_list`` (Supabase PostgREST rows)
+- ``GET /audio/{name}`` (a short silent WAV file)
+- ``GET /`` (a competitor homepage; search result links point back here)
+
+Run standalone with ``python bench/fakes.py --port 8900``.
+"""
+import argparse
+import asyncio
+import io
+import json
+import random
+import wave
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import StreamingResponse
+
+
+# Characters per streamed chunk, roughly a handful of tokens
+STREAM_CHUNK_CHARS = 40
+
+
+class Latency:
+    """A latency distribution parsed from a spec such as ``lognormal:800,0.5``.
+
+    Supported specs (milliseconds):
+      fixed:MS
+      uniform:LOW,HIGH
+      normal:MEAN,STDDEV
+      lognormal:MEDIAN,SIGMA
+    """
+
+    def __init__(self, spec="fixed:0", rng=None):
+        self.spec = spec
+        self.rng = rng or random.Random()
+        kind, _, args = spec.partition(":")
+        self.kind = kind
+        self.args = [float(a) for a in args.split(",") if a]
+        if kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self):
+        """Return one latency sample in seconds"""
+        if self.kind == "fixed":
+            ms = self.args[0] if self.args else 0
+        elif self.kind == "uniform":
+            ms = self.rng.uniform(*self.args)
+        elif self.kind == "normal":
+            ms = self.rng.gauss(*self.args)
+        else:
+            median, sigma = self.args
+            ms = self.rng.lognormvariate(0, sigma) * median
+        return max(ms, 0) / 1000
+
+    async def wait(self):
+        delay = self.sample()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+VALIDATION_CONTEMPLATOR = (
+    "The founder describes a scheduling assistant for independent clinics. The target market,\n"
+    "pricing and distribution are {}."
+)
+VALIDATION_RESPONSE = "Thanks. Who pays for this today, and how do clinics currently handle scheduling?"
+
+
+def validation_text(status, structured=False):
+    contemplator = VALIDATION_CONTEMPLATOR.format(
+        "clear enough to proceed" if status == "sufficient_information" else "still vague"
+    )
+    if structured:
+        return json.dumps({"contemplator": contemplator, "response": VALIDATION_RESPONSE, "status": status})
+    return f"""```xml
+<contemplator>
+{contemplator}
+</contemplator>
+<final_answer>
+{{"status": "{status}", "response": "{VALIDATION_RESPONSE}"}}
+</final_answer>
+```"""
+
+
+COMPETITORS = {
+    "competitors": [
+        {
+            "name": f"Competitor {i}",
+            "description": f"Competitor {i} sells scheduling software to small clinics.",
+            "differentiators": "Focuses on large hospital groups rather than independent practices.",
+            "url": f"https://competitor{i}.example.com",
+        }
+        for i in range(1, 5)
+    ]
+}
+
+MVP = {
+    "main_response": "Project Type: SaaS\nTech Stack: FastAPI, Postgres, React\n- Justification: Small team, fast iteration.",
+    "mermaid": {
+        "system_architecture": "Web App --> API --> Postgres",
+        "process_flow": "Patient --> Booking Page --> Clinic Calendar",
+    },
+    "code": "def book(slot): ...",
+}
+
+INVESTORS = [
+    {
+        "id": i,
+        "name": f"Investor {i}",
+        "firm": f"Fund {i}",
+        "focus": "Healthcare SaaS, seed stage",
+        "portfolio": "ClinicFlow, CareDesk",
+        "email": f"investor{i}@example.com",
+    }
+    for i in range(1, 21)
+]
+
+SELECTION = {
+    "investors": [
+        {"index": i - 1, "name": f"Investor {i}", "summary": f"Investor {i} at Fund {i} backs seed-stage healthcare SaaS."}
+        for i in range(1, 4)
+    ]
+}
+
+RECOMMENDATIONS = {
+    "investors": [f"Investor {i} at Fund {i} backs seed-stage healthcare SaaS." for i in range(1, 4)],
+    "emails": [f"Hi Investor {i}, given your work with ClinicFlow..." for i in range(1, 4)],
+}
+
+
+ANALYSIS = "The business sells scheduling software to independent clinics on a monthly subscription."
+
+
+def prompt_text(body):
+    """Concatenate the text parts of the last turn in a generateContent request"""
+    contents = body.get("contents") or []
+    if not contents:
+        return ""
+    return "\n".join(part.get("text", "") for part in contents[-1].get("parts", []))
+
+
+def gemini_reply(body, turns_to_sufficient):
+    """Pick a canned reply matching the prompt main.py sent"""
+    text = prompt_text(body)
+    # Later pipeline prompts embed the validation conversation, so match them first
+    if "search queries" in text:
+        return '["clinic scheduling software", "independent clinic booking saas", "patient appointment app"]'
+    if "DIRECT competitors" in text:
+        return json.dumps(COMPETITORS)
+    if "MVP" in text:
+        return json.dumps(MVP)
+    if "Write a personalized email" in text:
+        return "Hi, given your work with ClinicFlow, I'd love to share what we're building for independent clinics..."
+    if "Investor Database:" in text and "select the top" in text:
+        return json.dumps(SELECTION)
+    if "investor" in text.lower() and "email" in text.lower():
+        return json.dumps(RECOMMENDATIONS)
+    if "transcription" in text:
+        return "I want to build a scheduling assistant for independent clinics."
+    if "analyze the core business concept" in text:
+        return ANALYSIS
+    if "User Query:" in text:
+        turns = sum(1 for c in body.get("contents", []) if c.get("role") == "user")
+        status = "sufficient_information" if turns >= turns_to_sufficient else "insufficient_information"
+        # Schema-constrained requests get JSON, like the real API
+        structured = "responseSchema" in (body.get("generationConfig") or {})
+        return validation_text(status, structured)
+    return ANALYSIS
+
+
+def gemini_response(text, prompt_tokens):
+    candidate_tokens = max(len(text) // 4, 1)
+    return {
+        "candidates": [
+            {
+                "content": {"parts": [{"text": text}], "role": "model"},
+                "finishReason": "STOP",
+                "index": 0,
+            }
+        ],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": candidate_tokens,
+            "totalTokenCount": prompt_tokens + candidate_tokens,
+        },
+    }
+
+
+HOMEPAGE = """<!doctype html>
+<html><head>
+<title>ClinicFlow - Scheduling for independent clinics</title>
+<meta name="description" content="Online booking, reminders and calendar sync for small practices.">
+</head><body>
+<h1>Fill every appointment slot</h1>
+<h2>Self-service booking</h2>
+<h2>SMS reminders that cut no-shows</h2>
+<p>""" + "Lorem ipsum dolor sit amet. " * 2000 + """</p>
+</body></html>"""
+
+
+def silent_wav(seconds=1, rate=8000):
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b"\x00\x00" * rate * seconds)
+    return buf.getvalue()
+
+
+def create_app(gemini_latency="fixed:0", serp_latency="fixed:0", supabase_latency="fixed:0", turns_to_sufficient=1, seed=None,
+               homepage_latency="fixed:0"):
+    rng = random.Random(seed)
+    latencies = {
+        "gemini": Latency(gemini_latency, rng),
+        "serp": Latency(serp_latency, rng),
+        "supabase": Latency(supabase_latency, rng),
+        "homepage": Latency(homepage_latency, rng),
+    }
+    app = FastAPI()
+    app.state.calls = {"gemini": 0, "serp": 0, "supabase": 0, "homepage": 0}
+
+    @app.post("/v1beta/models/{model}:generateContent")
+    async def generate_content(model: str, request: Request):
+        body = await request.json()
+        app.state.calls["gemini"] += 1
+        await latencies["gemini"].wait()
+        prompt_tokens = max(len(json.dumps(body.get("contents", []))) // 4, 1)
+        return gemini_response(gemini_reply(body, turns_to_sufficient), prompt_tokens)
+
+    @app.post("/v1beta/models/{model}:streamGenerateContent")
+    async def stream_generate_content(model: str, request: Request):
+        body = await request.json()
+        app.state.calls["gemini"] += 1
+        text = gemini_reply(body, turns_to_sufficient)
+        prompt_tokens = max(len(json.dumps(body.get("contents", []))) // 4, 1)
+        pieces = [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)]
+        # Spread one latency sample over the chunks, like tokens arriving over time
+        delay = latencies["gemini"].sample() / len(pieces)
+
+        async def chunks():
+            for i, piece in enumerate(pieces):
+                await asyncio.sleep(delay)
+                chunk = gemini_response(piece, prompt_tokens)
+                if i < len(pieces) - 1:
+                    del chunk["candidates"][0]["finishReason"]
+                yield ("[" if i == 0 else ",") + json.dumps(chunk)
+            yield "]"
+
+        return StreamingResponse(chunks(), media_type="application/json")
+
+    @app.get("/search")
+    async def search(request: Request, q: str = ""):
+        app.state.calls["serp"] += 1
+        await latencies["serp"].wait()
+        return {
+            "search_metadata": {"status": "Success"},
+            "organic_results": [
+                {
+                    "position": i,
+                    "title": f"{q.title()} - Result {i}",
+                    "link": f"{request.base_url}companies/result{i}",
+                    "snippet": f"Result {i} for {q}: scheduling software for clinics.",
+                }
+                for i in range(1, 11)
+            ],
+        }
+
+    @app.get("/rest/v1/investor_list")
+    async def investor_list():
+        app.state.calls["supabase"] += 1
+        await latencies["supabase"].wait()
+        return INVESTORS
+
+    @app.get("/audio/{name}")
+    async def audio(name: str):
+        return Response(silent_wav(), media_type="audio/wav")
+
+    @app.get("/")
+    async def homepage():
+        app.state.calls["homepage"] += 1
+        await latencies["homepage"].wait()
+        return Response(HOMEPAGE, media_type="text/html; charset=utf-8")
+
+    @app.get("/calls")
+    async def calls():
+        return app.state.calls
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local fakes for Gemini, SerpAPI and Supabase")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--gemini-latency", default="lognormal:800,0.4")
+    parser.add_argument("--serp-latency", default="lognormal:300,0.3")
+    parser.add_argument("--supabase-latency", default="fixed:20")
+    parser.add_argument("--homepage-latency", default="lognormal:250,0.5")
+    parser.add_argument("--turns-to-sufficient", type=int, default=1)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    app = create_app(args.gemini_latency, args.serp_latency, args.supabase_latency, args.turns_to_sufficient, args.seed,
+                     args.homepage_latency)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
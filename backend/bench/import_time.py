@@ -0,0 +1,89 @@
+"""Measure how long it takes to import the backend and serve its first request.
+
+Usage (from the backend directory):
+    python bench/import_time.py [--runs 5] [--top 15]
+
+Each run starts a fresh interpreter with ``-X importtime``, imports ``main``
+and then issues one request to ``/`` through the ASGI app. Reports the median
+import and first-request wall time and the slowest modules by cumulative
+import time.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Namespace packages are reported by their first real subpackage
+NAMESPACE_PACKAGES = {"google.generativeai", "google.ai.generativelanguage", "google.protobuf"}
+
+PROBE = """
+import time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    client.get("/")
+    served = time.perf_counter()
+print(f"BENCH {imported - start:.4f} {served - start:.4f}")
+"""
+
+
+def run_once():
+    env = {
+        **os.environ,
+        # Dummy credentials so the app can start; no request leaves the machine
+        "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY", "bench"),
+        "SUPABASE_URL": os.getenv("SUPABASE_URL", "https://bench.supabase.co"),
+        "SUPABASE_KEY": os.getenv("SUPABASE_KEY", "bench.bench.bench"),
+        "LOG_LEVEL": "WARNING",
+    }
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    import_s, first_request_s = next(
+        line.split()[1:] for line in proc.stdout.splitlines() if line.startswith("BENCH")
+    )
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        if "." not in name or name in NAMESPACE_PACKAGES:
+            modules[name] = int(cumulative)
+    return float(import_s), float(first_request_s), modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    imports, first_requests, runs = [], [], []
+    for _ in range(args.runs):
+        import_s, first_request_s, modules = run_once()
+        imports.append(import_s)
+        first_requests.append(first_request_s)
+        runs.append(modules)
+
+    print(f"import main:          median {statistics.median(imports) * 1000:8.1f} ms")
+    print(f"import + first GET /: median {statistics.median(first_requests) * 1000:8.1f} ms")
+    print(f"\nSlowest top-level imports (median cumulative, ms):")
+    names = set().union(*runs)
+    medians = {name: statistics.median(run.get(name, 0) for run in runs) / 1000 for name in names}
+    for name, ms in sorted(medians.items(), key=lambda item: -item[1])[: args.top]:
+        print(f"  {ms:8.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Closed-loop load generator reporting throughput and latency percentiles.
+
+Usage:
+    python bench/loadgen.py --base-url http://127.0.0.1:8000 \\
+        --endpoint /market_analysis --concurrency 1,4,16 --requests 50
+
+Each concurrency level runs ``--requests`` requests per endpoint across that
+many workers, each issuing its next request as soon as the previous returns.
+``{request}`` in an endpoint is replaced by the request's number, e.g. to give
+each request its own ``session_id``.
+"""
+import argparse
+import asyncio
+import json
+import math
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+
+import httpx
+
+# Finishes the "default" session's conversation that the pipeline endpoints analyze
+PRIME_ENDPOINT = "/validate_idea?idea=A%20scheduling%20assistant%20for%20independent%20clinics"
+
+DEFAULT_ENDPOINTS = [
+    # A session per request, so load neither stacks turns nor replaces the primed history
+    PRIME_ENDPOINT + "&session_id=load-{request}",
+    "/market_analysis",
+    "/generate_mvp",
+    "/investor_recommendations",
+]
+
+
+@dataclass
+class LevelResult:
+    endpoint: str
+    concurrency: int
+    requests: int
+    errors: int
+    elapsed_s: float
+    statuses: dict = field(default_factory=dict)
+    latencies_ms: list = field(default_factory=list, repr=False)
+
+    @property
+    def throughput(self):
+        return self.requests / self.elapsed_s if self.elapsed_s else 0.0
+
+    def percentile(self, p):
+        return percentile(self.latencies_ms, p)
+
+    def summary(self):
+        data = asdict(self)
+        data.pop("latencies_ms")
+        data.update(
+            throughput_rps=round(self.throughput, 3),
+            p50_ms=round(self.percentile(50), 1),
+            p95_ms=round(self.percentile(95), 1),
+            p99_ms=round(self.percentile(99), 1),
+        )
+        return data
+
+
+def percentile(values, p):
+    """Nearest-rank percentile"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(math.ceil(p / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+async def run_level(client, endpoint, concurrency, total):
+    latencies = []
+    statuses = Counter()
+    errors = 0
+    remaining = total
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            path = endpoint.replace("{request}", str(total - remaining))
+            start = time.perf_counter()
+            try:
+                response = await client.get(path)
+                statuses[response.status_code] += 1
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+                errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return LevelResult(endpoint, concurrency, total, errors, elapsed, dict(statuses), latencies)
+
+
+async def run(base_url, endpoints, levels, total, timeout=300):
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    results = []
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        for endpoint in endpoints:
+            for concurrency in levels:
+                result = await run_level(client, endpoint, concurrency, total)
+                print(format_row(result), flush=True)
+                results.append(result)
+    return results
+
+
+HEADER = f"{'endpoint':<32} {'conc':>5} {'reqs':>5} {'err':>4} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+
+
+def format_row(result):
+    name = result.endpoint.split("?")[0]
+    return (
+        f"{name:<32} {result.concurrency:>5} {result.requests:>5} {result.errors:>4} "
+        f"{result.throughput:>8.2f} {result.percentile(50):>9.1f} {result.percentile(95):>9.1f} {result.percentile(99):>9.1f}"
+    )
+
+
+def parse_levels(text):
+    return [int(level) for level in text.split(",") if level]
+
+
+def add_arguments(parser):
+    parser.add_argument("--endpoint", action="append", dest="endpoints", help="Path to load; repeatable (default: all LLM endpoints)")
+    parser.add_argument("--concurrency", type=parse_levels, default=[1, 4, 16], help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per endpoint and concurrency level")
+    parser.add_argument("--json", dest="json_path", help="Write results as JSON to this file")
+
+
+def write_json(results, path):
+    with open(path, "w") as f:
+        json.dump([r.summary() for r in results], f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Closed-loop HTTP load generator")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    print(HEADER)
+    results = asyncio.run(run(args.base_url, args.endpoints or DEFAULT_ENDPOINTS, args.concurrency, args.requests))
+    if args.json_path:
+        write_json(results, args.json_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Benchmark the backend end to end against local fakes.
+
+Boots the fake Gemini/SerpAPI/Supabase server from ``fakes.py``, starts the
+FastAPI app under uvicorn pointed at it, primes a sufficient validation
+history and then runs ``loadgen.py`` at each concurrency level. With
+``--cassette`` the app records its upstream calls to, or replays them from, a
+cassette file; replay needs neither the fakes nor the network. With
+``--state-backend redis`` a local Redis stand-in from ``fake_redis.py`` holds
+the shared state. The pipeline result cache is off unless ``--result-cache``
+is given, since every request reuses the same primed history.
+
+Usage (from the backend directory):
+    python bench/run.py --concurrency 1,4,16 --requests 20 \\
+        --gemini-latency lognormal:800,0.4 --serp-latency lognormal:300,0.3
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+import uvicorn
+
+import fake_redis
+import fakes
+import loadgen
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+UNREACHABLE_URL = "http://127.0.0.1:9"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def start_fakes(args):
+    port = free_port()
+    app = fakes.create_app(
+        args.gemini_latency, args.serp_latency, args.supabase_latency, seed=args.seed, homepage_latency=args.homepage_latency
+    )
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    wait_until_up(f"http://127.0.0.1:{port}/calls")
+    return server, f"http://127.0.0.1:{port}"
+
+
+def start_fake_redis():
+    port = free_port()
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(fake_redis.create_server(fake_redis.FakeRedis(), "127.0.0.1", port))
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return server, f"redis://127.0.0.1:{port}/0"
+
+
+def backend_env(fakes_url, extra=None):
+    """Environment that points every upstream client at the fakes"""
+    return {
+        **os.environ,
+        "GOOGLE_API_KEY": "bench",
+        "GEMINI_API_ENDPOINT": fakes_url,
+        "SERPAPI_KEY": "bench",
+        "SERPAPI_URL": f"{fakes_url}/search",
+        "SUPABASE_URL": fakes_url,
+        "SUPABASE_KEY": "bench",
+        "LOG_LEVEL": "WARNING",
+        # Every request reuses the primed history, so cached results would hide the pipeline
+        "RESULT_CACHE_TTL": "0",
+        # The fake homepages are served from 127.0.0.1
+        "ENRICH_ALLOW_PRIVATE": "1",
+        **(extra or {}),
+    }
+
+
+def start_backend(fakes_url, workdir, workers=1, extra_env=None):
+    port = free_port()
+    proc = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--app-dir", BACKEND_DIR,
+            "--host", "127.0.0.1",
+            "--port", str(port),
+            "--workers", str(workers),
+            "--log-level", "warning",
+        ],
+        cwd=workdir,
+        env=backend_env(fakes_url, extra_env),
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_up(f"{base_url}/")
+    except Exception:
+        proc.terminate()
+        raise
+    return proc, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark against local fakes")
+    parser.add_argument("--gemini-latency", default="lognormal:800,0.4")
+    parser.add_argument("--serp-latency", default="lognormal:300,0.3")
+    parser.add_argument("--supabase-latency", default="fixed:20")
+    parser.add_argument("--homepage-latency", default="lognormal:250,0.5")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--state-backend", choices=["sqlite", "memory", "redis"], default="sqlite")
+    parser.add_argument("--result-cache", action="store_true", help="Serve repeated pipeline requests from the result cache")
+    parser.add_argument("--cassette", help="Cassette file to record to or replay from")
+    parser.add_argument("--cassette-mode", choices=["record", "replay"], default="replay")
+    parser.add_argument("--cassette-timing", default="recorded", help="recorded, none, scale:F or fixed:MS")
+    loadgen.add_arguments(parser)
+    args = parser.parse_args()
+
+    extra_env = {"STATE_BACKEND": args.state_backend}
+    if args.result_cache:
+        extra_env["RESULT_CACHE_TTL"] = "3600"
+    if args.state_backend == "redis":
+        _, extra_env["REDIS_URL"] = start_fake_redis()
+    if args.cassette:
+        extra_env |= {
+            "CASSETTE_MODE": args.cassette_mode,
+            "CASSETTE_PATH": os.path.abspath(args.cassette),
+            "CASSETTE_TIMING": args.cassette_timing,
+        }
+
+    if args.cassette and args.cassette_mode == "replay":
+        # Nothing listens here, so any call that misses the cassette fails loudly
+        fakes_url = UNREACHABLE_URL
+    else:
+        _, fakes_url = start_fakes(args)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        proc, base_url = start_backend(fakes_url, workdir, args.workers, extra_env)
+        try:
+            # Later endpoints need a finalized validation history
+            httpx.get(f"{base_url}{loadgen.PRIME_ENDPOINT}", timeout=60).raise_for_status()
+
+            if fakes_url == UNREACHABLE_URL:
+                print(f"replaying {args.cassette} (timing: {args.cassette_timing})")
+            else:
+                print(f"fakes: gemini={args.gemini_latency} serp={args.serp_latency} supabase={args.supabase_latency}")
+            print(loadgen.HEADER)
+            results = asyncio.run(
+                loadgen.run(base_url, args.endpoints or loadgen.DEFAULT_ENDPOINTS, args.concurrency, args.requests)
+            )
+            if args.json_path:
+                loadgen.write_json(results, args.json_path)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
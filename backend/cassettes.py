@@ -0,0 +1,155 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+logger = logging.getLogger(__name__)
+
+
+class CassetteMiss(KeyError):
+    """Raised in replay mode when no recorded interaction matches a request"""
+
+
+def fingerprint(value):
+    """Reduce prompt contents (strings, lists, chat history protos) to plain JSON"""
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, dict):
+        return {k: fingerprint(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [fingerprint(v) for v in value]
+    if hasattr(value, "parts"):
+        return {"role": getattr(value, "role", ""), "parts": [fingerprint(p) for p in value.parts]}
+    if hasattr(value, "text"):
+        return value.text
+    # Uploaded files and other opaque objects differ on every run
+    return f"<{type(value).__name__}>"
+
+
+def content_hash(value):
+    data = json.dumps(fingerprint(value), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def encode_gemini_response(response):
+    usage = getattr(response, "usage_metadata", None)
+    return {
+        "text": response.text,
+        "usage": {
+            field: getattr(usage, field, 0)
+            for field in ("prompt_token_count", "candidates_token_count", "total_token_count")
+        } if usage is not None else None,
+    }
+
+
+def decode_gemini_response(data):
+    """Stand-in for a GenerateContentResponse exposing what the app reads"""
+    usage = data.get("usage")
+    return SimpleNamespace(
+        text=data["text"],
+        usage_metadata=SimpleNamespace(**usage) if usage else None,
+    )
+
+
+class Cassette:
+    """Records upstream interactions to a gzipped JSON-lines file and replays them.
+
+    Entries are keyed by the kind of call and a hash of its request fields, so
+    prompts are stored only as hashes. Identical requests replay in recorded
+    order, repeating the last entry once exhausted. Replay timing is one of
+    ``recorded`` (sleep for the recorded duration), ``none``, ``scale:F`` or
+    ``fixed:MS``.
+    """
+
+    def __init__(self, path, mode, timing="recorded"):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.timing = timing
+        self._lock = threading.Lock()
+        self._entries = defaultdict(list)
+        self._positions = defaultdict(int)
+        self._opened = False
+
+    def open(self):
+        """Load the recordings or create the cassette directory, once"""
+        with self._lock:
+            if self._opened:
+                return
+            if self.mode == "replay":
+                self._load()
+            else:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._opened = True
+
+    @classmethod
+    def from_env(cls):
+        mode = os.getenv("CASSETTE_MODE")
+        if not mode:
+            return None
+        path = os.getenv("CASSETTE_PATH", os.path.join("cassettes", "default.jsonl.gz"))
+        logger.info("Cassette %s mode using %s", mode, path)
+        return cls(path, mode, os.getenv("CASSETTE_TIMING", "recorded"))
+
+    @staticmethod
+    def key(kind, request):
+        return f"{kind}:{content_hash(request)}"
+
+    def _load(self):
+        with gzip.open(self.path, "rt") as f:
+            for line in f:
+                entry = json.loads(line)
+                self._entries[entry["key"]].append(entry)
+        logger.info("Loaded %s cassette entries from %s", sum(len(v) for v in self._entries.values()), self.path)
+
+    def _append(self, entry):
+        with self._lock:
+            # Each append adds a gzip member; gzip readers concatenate them
+            with gzip.open(self.path, "at") as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def _delay(self, elapsed):
+        kind, _, arg = self.timing.partition(":")
+        if kind == "recorded":
+            return elapsed
+        if kind == "scale":
+            return elapsed * float(arg)
+        if kind == "fixed":
+            return float(arg) / 1000
+        return 0
+
+    async def play(self, kind, request, call, encode=lambda r: r, decode=lambda d: d):
+        """Record the result of ``call()`` or replay a previously recorded one"""
+        if not self._opened:
+            self.open()
+        key = self.key(kind, request)
+        if self.mode == "record":
+            start = time.perf_counter()
+            result = await call()
+            self._append({
+                "key": key,
+                "kind": kind,
+                "request": request,
+                "elapsed": round(time.perf_counter() - start, 4),
+                "response": encode(result),
+            })
+            return result
+
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise CassetteMiss(f"No recorded {kind} interaction for {key}")
+            position = self._positions[key]
+            self._positions[key] = position + 1
+        entry = entries[min(position, len(entries) - 1)]
+        delay = self._delay(entry["elapsed"])
+        if delay:
+            await asyncio.sleep(delay)
+        return decode(entry["response"])
@@ -0,0 +1,315 @@
+import asyncio
+import codecs
+import ipaddress
+import logging
+import socket
+import time
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+
+from metrics import record_cache, upstream_timer
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "PathfinderBot/1.0 (+competitor research)"
+
+# Aggregators, directories and social sites rarely are the competitor itself
+SKIP_DOMAINS = {
+    "capterra.com", "crunchbase.com", "facebook.com", "forbes.com", "g2.com",
+    "getapp.com", "instagram.com", "linkedin.com", "medium.com", "quora.com",
+    "reddit.com", "trustpilot.com", "twitter.com", "wikipedia.org", "x.com",
+    "youtube.com",
+}
+
+# Failed fetches are remembered for less time than summaries
+FAILURE_TTL = 3600
+
+MAX_REDIRECTS = 3
+
+
+class BlockedAddress(ValueError):
+    """Raised for URLs that resolve to loopback, private, link-local or other non-public addresses"""
+
+
+class PageSummaryParser(HTMLParser):
+    """Collects a page's title, meta description and first headings from streamed HTML"""
+
+    MAX_HEADINGS = 8
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ""
+        self.description = ""
+        self.headings = []
+        self.done = False
+        self._capture = None
+        self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "meta":
+            attrs = dict(attrs)
+            name = (attrs.get("name") or attrs.get("property") or "").lower()
+            if name in ("description", "og:description") and not self.description:
+                self.description = " ".join((attrs.get("content") or "").split())
+        elif (tag == "title" and not self.title) or tag in ("h1", "h2", "h3"):
+            self._capture = tag
+            self._text = []
+
+    def handle_endtag(self, tag):
+        if tag != self._capture:
+            return
+        text = " ".join("".join(self._text).split())
+        if tag == "title":
+            self.title = text
+        elif text:
+            self.headings.append(text)
+            self.done = len(self.headings) >= self.MAX_HEADINGS
+        self._capture = None
+
+    def handle_data(self, data):
+        if self._capture:
+            self._text.append(data)
+
+    def summary(self):
+        return {
+            "title": self.title[:200],
+            "description": self.description[:500],
+            "headings": [heading[:200] for heading in self.headings[:self.MAX_HEADINGS]],
+        }
+
+
+def is_public_address(address):
+    ip = ipaddress.ip_address(address)
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+async def resolve_public_addresses(host, port):
+    """Resolve host, raising BlockedAddress unless every address it has is public"""
+    try:
+        addresses = [str(ipaddress.ip_address(host))]
+    except ValueError:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+    if not addresses or not all(is_public_address(address) for address in addresses):
+        raise BlockedAddress(f"{host} resolves to a non-public address")
+    return addresses
+
+
+class PublicAddressBackend:
+    """httpcore network backend that only connects to public addresses.
+
+    The host is resolved once and the connection goes to one of the checked
+    addresses, so a host cannot pass the check and then resolve to a private
+    one (DNS rebinding). TLS still verifies the certificate for the hostname.
+    """
+
+    def __init__(self):
+        import httpcore
+
+        self._backend = httpcore.AnyIOBackend()
+        self._connect_errors = (httpcore.ConnectError, httpcore.ConnectTimeout)
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        error = None
+        for address in await resolve_public_addresses(host, port):
+            try:
+                return await self._backend.connect_tcp(address, port, timeout, local_address, socket_options)
+            except self._connect_errors as e:
+                error = e
+        raise error
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        raise BlockedAddress("Unix sockets are not public addresses")
+
+    async def sleep(self, seconds):
+        await self._backend.sleep(seconds)
+
+
+def public_only_transport():
+    """An httpx transport whose connections go through PublicAddressBackend"""
+    import httpcore
+    import httpx
+
+    transport = httpx.AsyncHTTPTransport()
+    # httpx takes no network backend, so swap in a pool that uses ours
+    transport._pool = httpcore.AsyncConnectionPool(
+        ssl_context=httpx.create_ssl_context(),
+        max_keepalive_connections=20,
+        keepalive_expiry=5.0,
+        network_backend=PublicAddressBackend(),
+    )
+    return transport
+
+
+async def fetch_page_summary(client, url, max_bytes):
+    """Stream a page and parse it until enough is found or max_bytes is read.
+
+    Redirects are followed by hand, at most MAX_REDIRECTS of them. Whether
+    non-public hosts are refused on every hop is up to the client's transport.
+    """
+    parser = PageSummaryParser()
+    for _ in range(MAX_REDIRECTS + 1):
+        async with client.stream("GET", url) as response:
+            if response.is_redirect:
+                url = urljoin(url, response.headers["location"])
+                continue
+            response.raise_for_status()
+            content_type = response.headers.get("content-type", "")
+            if "html" not in content_type:
+                raise ValueError(f"Not an HTML page: {content_type}")
+            try:
+                decoder = codecs.getincrementaldecoder(response.charset_encoding or "utf-8")("replace")
+            except LookupError:
+                decoder = codecs.getincrementaldecoder("utf-8")("replace")
+
+            received = 0
+            async for chunk in response.aiter_bytes(8192):
+                received += len(chunk)
+                parser.feed(decoder.decode(chunk))
+                if parser.done or received >= max_bytes:
+                    break
+            return parser.summary()
+    raise ValueError(f"More than {MAX_REDIRECTS} redirects")
+
+
+def homepage_url(url):
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.netloc:
+        return None
+    return f"{parts.scheme}://{parts.netloc}/"
+
+
+def candidate_homepages(urls, limit):
+    """Unique homepages in result order, skipping aggregator sites"""
+    homepages = []
+    for url in urls:
+        homepage = homepage_url(url)
+        if not homepage or homepage in homepages:
+            continue
+        host = urlsplit(homepage).hostname or ""
+        if any(host == domain or host.endswith("." + domain) for domain in SKIP_DOMAINS):
+            continue
+        homepages.append(homepage)
+        if len(homepages) >= limit:
+            break
+    return homepages
+
+
+class HomepageEnricher:
+    """Fetches and summarizes candidate competitors' homepages in one bounded, parallel round.
+
+    Summaries are cached per domain in the state backend. At most
+    ``concurrency`` fetches run at once, one at a time per domain and no more
+    often than ``domain_interval`` seconds apart; the whole round finishes
+    within ``timeout`` seconds, cancelling fetches still in flight. Hosts
+    that resolve to non-public addresses are refused unless ``allow_private``.
+    """
+
+    # Per-domain locks and fetch times kept before idle ones are dropped
+    MAX_TRACKED_DOMAINS = 1024
+
+    def __init__(self, state, cassette=None, concurrency=8, timeout=3.0, max_bytes=256 * 1024,
+                 ttl=86400, domain_interval=1.0, max_domains=8, allow_private=False):
+        self.state = state
+        self.cassette = cassette
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.domain_interval = domain_interval
+        self.max_domains = max_domains
+        self.allow_private = allow_private
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._domain_locks = {}
+        self._last_fetch = {}
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            # Imported on first fetch, like the Gemini SDK; httpx is slow to import
+            import httpx
+
+            self._client = httpx.AsyncClient(
+                transport=None if self.allow_private else public_only_transport(),
+                timeout=self.timeout,
+                follow_redirects=False,
+                headers={"User-Agent": USER_AGENT},
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def enrich(self, urls):
+        """Return summaries for the top candidate homepages among urls, skipping failures"""
+        homepages = candidate_homepages(urls, self.max_domains)
+        deadline = time.monotonic() + self.timeout
+        tasks = [asyncio.ensure_future(self.summarize(homepage, deadline)) for homepage in homepages]
+        if not tasks:
+            return []
+        done, pending = await asyncio.wait(tasks, timeout=self.timeout)
+        for task in pending:
+            task.cancel()
+        summaries = [task.result() for task in tasks if task in done and not task.exception()]
+        logger.info("Enriched %s/%s competitor homepages", sum(1 for s in summaries if s), len(homepages))
+        return [summary for summary in summaries if summary]
+
+    async def summarize(self, homepage, deadline):
+        domain = urlsplit(homepage).netloc
+        key = f"homepage:{domain}"
+        cached = await self.state.get(key)
+        record_cache("homepage", cached is not None)
+        if cached is not None:
+            return cached or None
+
+        if len(self._domain_locks) >= self.MAX_TRACKED_DOMAINS:
+            self._prune()
+        async with self._domain_locks.setdefault(domain, asyncio.Lock()):
+            # Another request may have fetched this domain while we waited
+            cached = await self.state.get(key)
+            if cached is not None:
+                return cached or None
+
+            wait = self._last_fetch.get(domain, 0) + self.domain_interval - time.monotonic()
+            if wait > 0:
+                if time.monotonic() + wait >= deadline:
+                    return None
+                await asyncio.sleep(wait)
+
+            async with self._semaphore:
+                self._last_fetch[domain] = time.monotonic()
+                try:
+                    summary = await self.fetch(homepage)
+                except Exception as e:
+                    logger.info("Could not fetch %s: %s", homepage, e)
+                    await self.remember(key, {}, min(self.ttl, FAILURE_TTL))
+                    return None
+
+            summary = {"url": homepage, **summary}
+            await self.remember(key, summary, self.ttl)
+        return summary
+
+    def _prune(self):
+        """Forget domains that are neither locked nor inside their politeness interval"""
+        cutoff = time.monotonic() - self.domain_interval
+        for domain, lock in list(self._domain_locks.items()):
+            if not lock.locked() and self._last_fetch.get(domain, 0) < cutoff:
+                del self._domain_locks[domain]
+                self._last_fetch.pop(domain, None)
+
+    async def remember(self, key, value, ttl):
+        if ttl > 0:
+            await self.state.set(key, value, ttl=ttl)
+
+    async def fetch(self, homepage):
+        def call():
+            return fetch_page_summary(self.client, homepage, self.max_bytes)
+
+        with upstream_timer("homepage", "fetch"):
+            if self.cassette is None:
+                return await call()
+            return await self.cassette.play("homepage", {"url": homepage}, call)
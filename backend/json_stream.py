@@ -0,0 +1,63 @@
+import json
+
+
+class JsonFieldParser:
+    """Incrementally parse a streamed JSON object, returning each top-level field once complete.
+
+    Only tracks string and nesting state, so each character is scanned once
+    however the text is chunked; a field's value is decoded with json.loads
+    when the comma or closing brace after it arrives. Raises ValueError if
+    the top-level value is an array.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.key_start = None
+        self.key = None
+        self.value_start = None
+        self.done = False
+
+    def feed(self, text):
+        """Add streamed text and return the (name, value) pairs it completed"""
+        self.buffer += text
+        fields = []
+        while self.pos < len(self.buffer) and not self.done:
+            c = self.buffer[self.pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+                    if self.depth == 1 and self.value_start is None:
+                        self.key = json.loads(self.buffer[self.key_start:self.pos + 1])
+            elif c == '"':
+                self.in_string = True
+                if self.depth == 1 and self.value_start is None:
+                    self.key_start = self.pos
+            elif c == ":" and self.depth == 1 and self.value_start is None:
+                self.value_start = self.pos + 1
+            elif c in "{[":
+                if self.depth == 0 and c == "[":
+                    raise ValueError("Expected a JSON object, got an array")
+                self.depth += 1
+            elif c in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    self._complete_field(fields)
+                    self.done = True
+            elif c == "," and self.depth == 1:
+                self._complete_field(fields)
+            self.pos += 1
+        return fields
+
+    def _complete_field(self, fields):
+        if self.value_start is not None:
+            fields.append((self.key, json.loads(self.buffer[self.value_start:self.pos])))
+        self.key = None
+        self.value_start = None
@@ -0,0 +1,120 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Environment variables whose values must never reach the logs
+SECRET_ENV_VARS = ("GOOGLE_API_KEY", "SERPAPI_KEY", "SUPABASE_KEY")
+
+# Matches key/value pairs such as api_key=..., 'api_key': '...', "token": "..."
+# or Authorization: Bearer ..., keeping any auth scheme and masking the credential
+SECRET_PATTERN = re.compile(
+    r"""(?i)(['"]?\b(?:api_key|apikey|access_token|token|secret|password|authorization)\b['"]?\s*[:=]\s*['"]?(?:(?:bearer|basic)\s+)?)([^'"&\s,}]+)"""
+)
+
+REDACTED = "[REDACTED]"
+
+# Log arguments of these types can be formatted later without changing the message
+IMMUTABLE_ARG_TYPES = (str, int, float, bool, bytes, type(None))
+
+_listener = None
+
+
+def redact(text):
+    """Mask secret values in a log message"""
+    text = SECRET_PATTERN.sub(lambda m: m.group(1) + REDACTED, text)
+    for name in SECRET_ENV_VARS:
+        value = os.getenv(name)
+        if value and len(value) >= 8:
+            text = text.replace(value, REDACTED)
+    return text
+
+
+class RedactingFormatter(logging.Formatter):
+    """Plain-text formatter that masks secrets"""
+
+    def format(self, record):
+        return redact(super().format(record))
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with secrets masked"""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": redact(record.getMessage()),
+        }
+        if record.exc_info:
+            entry["exc_info"] = redact(self.formatException(record.exc_info))
+        return json.dumps(entry)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that leaves message formatting to the listener thread.
+
+    The stock QueueHandler formats every record in the calling thread so it can
+    be pickled; our queue is in-process, so the request path only pays for an
+    enqueue and the listener does the string work. Records whose arguments
+    could change before the listener gets to them (lists, objects) are
+    merged into their message first.
+    """
+
+    def prepare(self, record):
+        if record.args:
+            values = record.args.values() if isinstance(record.args, dict) else record.args
+            if not all(isinstance(value, IMMUTABLE_ARG_TYPES) for value in values):
+                record.msg = record.getMessage()
+                record.args = None
+        return record
+
+
+def should_sample(rate=None):
+    """Decide whether to emit a sampled verbose log entry"""
+    if rate is None:
+        rate = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1"))
+    return rate >= 1 or random.random() < rate
+
+
+def setup_logging():
+    """Route all logging through a queue drained by a background listener"""
+    global _listener
+    if _listener is not None:
+        return
+
+    level = os.getenv("LOG_LEVEL", "INFO").upper()
+    if os.getenv("LOG_FORMAT", "text").lower() == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = RedactingFormatter(LOG_FORMAT)
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers = [DeferredQueueHandler(log_queue)]
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flush queued records, stop the listener thread and log directly from then on"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        # Nothing drains the queue any more, so later records must not go to it
+        logging.getLogger().handlers = list(_listener.handlers)
+        _listener = None
+        atexit.unregister(shutdown_logging)
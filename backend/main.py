@@ -1,82 +1,75 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-import google.generativeai as genai
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from functools import lru_cache
 import os
+import asyncio
 from dotenv import load_dotenv
 import json
 import requests
 import logging
 import time
 import pickle
-from supabase import create_client, Client
+import uuid
+from model_registry import ModelRegistry
+import metrics
+import admission
+import profiling
+from cassettes import Cassette, content_hash
+from logging_config import setup_logging, shutdown_logging, should_sample
+from metrics import record_cache, record_validation_parse, stage_timer, upstream_timer
+from state import create_state_backend
+from batch import RateLimiter, run_batch
+from json_stream import JsonFieldParser
+from enrichment import HomepageEnricher
+
+# Load environment variables before any settings below are read
+load_dotenv()
 
-# Load prompt from file
-prompt = open("prompt.txt").read()
+PROMPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompt.txt")
 
-# Create a directory for storing chat history if it doesn't exist
+# Directories for chat history and audio files, created at startup
 HISTORY_DIR = "chat_history"
-if not os.path.exists(HISTORY_DIR):
-    os.makedirs(HISTORY_DIR)
-
-# Create a directory for storing audio files if it doesn't exist
 AUDIO_DIR = "audio_files"
-if not os.path.exists(AUDIO_DIR):
-    os.makedirs(AUDIO_DIR)
 
-def save_chat_history(history):
-    """Save chat history to a file"""
-    try:
-        logger.info(f"Attempting to save chat history. History type: {type(history)}, Length: {len(history) if history else 0}")
-        history_path = os.path.join(HISTORY_DIR, "latest_history.pkl")
-        logger.info(f"Saving to path: {history_path}")
-        
-        # Create directory if it doesn't exist
-        if not os.path.exists(HISTORY_DIR):
-            logger.info(f"Creating directory: {HISTORY_DIR}")
-            os.makedirs(HISTORY_DIR)
-        
-        with open(history_path, "wb") as f:
-            pickle.dump(history, f)
-        logger.info(f"Successfully saved chat history to {history_path}")
-    except Exception as e:
-        logger.error(f"Failed to save chat history: {str(e)}")
-        logger.error(f"Error type: {type(e)}")
-        logger.error(f"Current working directory: {os.getcwd()}")
-        raise
+# Validation turns on /validate_idea, /validate_audio and /validate_batch use the
+# schema-constrained "validation" model; set to 0 for the XML output of prompt.txt
+STRUCTURED_VALIDATION = os.getenv("VALIDATION_STRUCTURED_OUTPUT", "1") == "1"
+VALIDATION_MODEL = "validation" if STRUCTURED_VALIDATION else "chat"
 
-def load_chat_history():
-    """Load chat history from file"""
-    try:
-        history_path = os.path.join(HISTORY_DIR, "latest_history.pkl")
-        logger.info(f"Attempting to load chat history from: {history_path}")
-        
-        if not os.path.exists(HISTORY_DIR):
-            logger.error(f"Chat history directory does not exist: {HISTORY_DIR}")
-            return None
-            
-        if not os.path.exists(history_path):
-            logger.error(f"Chat history file does not exist: {history_path}")
-            return None
-            
-        with open(history_path, "rb") as f:
-            history = pickle.load(f)
-            logger.info(f"Successfully loaded chat history. Type: {type(history)}, Length: {len(history) if history else 0}")
-            return history
-    except Exception as e:
-        logger.error(f"Failed to load chat history: {str(e)}")
-        logger.error(f"Error type: {type(e)}")
-        logger.error(f"Current working directory: {os.getcwd()}")
-        return None
+STRUCTURED_OUTPUT_NOTE = """
+OUTPUT FORMAT OVERRIDE: Do not use the XML tags or code block markers. Respond with a single JSON object with the fields "contemplator" (your internal monologue), "status" and "response", filled in exactly as the output formats above describe.
+"""
+
+@lru_cache(maxsize=None)
+def get_prompt():
+    """Load the validation prompt from file on first use"""
+    with open(PROMPT_PATH) as f:
+        return f.read()
+
+def validation_prompt():
+    """The validation prompt for the configured output mode"""
+    return get_prompt() + STRUCTURED_OUTPUT_NOTE if STRUCTURED_VALIDATION else get_prompt()
+
+def log_chat_history(history):
+    """Dump every message of a chat history at DEBUG level"""
+    for i, msg in enumerate(history):
+        parts = getattr(msg, 'parts', None)
+        logger.debug("Message %d: %s parts", i + 1, len(parts) if parts is not None else 'No')
+        for j, part in enumerate(parts or []):
+            logger.debug("    Part %d: %.100s...", j + 1, part)
 
 def save_serp_results(queries, results):
     """Save SERP results to a file"""
     try:
-        logger.info(f"Attempting to save SERP results for {len(queries)} queries")
+        logger.info("Attempting to save SERP results for %s queries", len(queries))
         serp_path = os.path.join(HISTORY_DIR, "latest_serp_results.pkl")
         
         # Create directory if it doesn't exist
         if not os.path.exists(HISTORY_DIR):
-            logger.info(f"Creating directory: {HISTORY_DIR}")
+            logger.info("Creating directory: %s", HISTORY_DIR)
             os.makedirs(HISTORY_DIR)
         
         # Save both queries and results to ensure we can validate later
@@ -88,10 +81,10 @@ def save_serp_results(queries, results):
         
         with open(serp_path, "wb") as f:
             pickle.dump(data, f)
-        logger.info(f"Successfully saved SERP results to {serp_path}")
+        logger.info("Successfully saved SERP results to %s", serp_path)
         return True
     except Exception as e:
-        logger.error(f"Failed to save SERP results: {str(e)}")
+        logger.error("Failed to save SERP results: %s", e)
         return False
 
 def load_serp_results(current_queries):
@@ -116,19 +109,45 @@ def load_serp_results(current_queries):
         return data["results"]
             
     except Exception as e:
-        logger.error(f"Failed to load SERP results: {str(e)}")
+        logger.error("Failed to load SERP results: %s", e)
         return None
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    """Start logging, check configuration, create data directories and open state and cassette storage; clients are built on first use"""
+    setup_logging()
+    if not os.getenv("GOOGLE_API_KEY"):
+        raise ValueError("GOOGLE_API_KEY environment variable is not set")
 
-# Load environment variables
-load_dotenv()
+    os.makedirs(HISTORY_DIR, exist_ok=True)
+    os.makedirs(AUDIO_DIR, exist_ok=True)
+    await state.open()
+    if cassette is not None:
+        cassette.open()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+    # Import and build clients in the background once the server is accepting requests
+    if os.getenv("PREWARM_CLIENTS", "1") == "1":
+        asyncio.get_running_loop().run_in_executor(None, prewarm_clients)
+
+    yield
+
+    await enricher.close()
+    await state.close()
+    models.close()
+    shutdown_logging()
+
+app = FastAPI(lifespan=lifespan)
+
+# Opt-in per-request profiling (PROFILE_ADMIN_TOKEN / PROFILE_SAMPLE_RATE)
+profiling.install(app)
+
+# Per-endpoint concurrency limits and queues; shed load with 503 beyond them
+admission.install(app)
+
+# Request latency, in-flight counts and the /metrics endpoint
+metrics.install(app)
+
+# Logging is started by the lifespan and stopped when it ends
 logger = logging.getLogger(__name__)
 
 # Configure CORS
@@ -140,196 +159,484 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Configure Gemini
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if not GOOGLE_API_KEY:
-    raise ValueError("GOOGLE_API_KEY environment variable is not set")
-
-genai.configure(api_key=GOOGLE_API_KEY)
-model = genai.GenerativeModel('gemini-2.0-flash')
-
-# Global chat history
-chat = model.start_chat(history=[])
-# Store the most recent sufficient history
-latest_sufficient_history = None
-
-# Competitor search model configurations
-competitor_generation_config = {
-    "temperature": 1,
-    "top_p": 0.95,
-    "top_k": 40,
-    "max_output_tokens": 8192,
-}
-
-structured_competitor_generation_config = {
-    "temperature": 1,
-    "top_p": 0.95,
-    "top_k": 40,
-    "max_output_tokens": 8192,
-    "response_mime_type": "application/json",
-}
-
-# Initialize competitor search models
-analysis_model = genai.GenerativeModel(
-    model_name="gemini-2.0-flash",
-    generation_config=competitor_generation_config,
-)
-
-searchquery_model = genai.GenerativeModel(
-    model_name="gemini-2.0-flash",
-    generation_config=competitor_generation_config,
+# Record or replay upstream calls when CASSETTE_MODE is set
+cassette = Cassette.from_env()
+
+# Named Gemini clients, generation configs and concurrency limits
+models = ModelRegistry(cassette=cassette)
+
+# Validation conversations, the latest sufficient history and cached pipeline
+# results live here so every worker sees the same state (STATE_BACKEND)
+state = create_state_backend()
+
+# Validation turns share one conversation unless a session_id is given; the
+# downstream endpoints read the finished conversation of the same session_id.
+# WebSocket conversations keep their own chat session for the life of the connection.
+DEFAULT_SESSION_ID = "default"
+
+# Seconds an idle or finished conversation and a cached pipeline result are kept
+SESSION_TTL = int(os.getenv("SESSION_TTL", "86400"))
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", "3600"))
+
+# Batch screening limits; the rate limit is shared by every batch in this process
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+batch_limiter = RateLimiter(int(os.getenv("BATCH_REQUESTS_PER_MINUTE", "0")))
+
+SERPAPI_URL = os.getenv("SERPAPI_URL", "https://serpapi.com/search")
+
+# Homepage summaries of candidate competitors, fetched in one parallel round
+COMPETITOR_ENRICHMENT = os.getenv("COMPETITOR_ENRICHMENT", "1") == "1"
+enricher = HomepageEnricher(
+    state,
+    cassette,
+    concurrency=int(os.getenv("ENRICH_CONCURRENCY", "8")),
+    timeout=float(os.getenv("ENRICH_TIMEOUT", "3")),
+    max_bytes=int(os.getenv("ENRICH_MAX_BYTES", str(256 * 1024))),
+    ttl=int(os.getenv("ENRICH_CACHE_TTL", "86400")),
+    domain_interval=float(os.getenv("ENRICH_DOMAIN_INTERVAL", "1")),
+    max_domains=int(os.getenv("ENRICH_MAX_DOMAINS", "8")),
+    allow_private=os.getenv("ENRICH_ALLOW_PRIVATE", "0") == "1",
 )
 
-competitorfinder_model = genai.GenerativeModel(
-    model_name="gemini-2.0-flash",
-    generation_config=structured_competitor_generation_config,
-)
-
-# Add Supabase client configuration after other configurations
+# Supabase client, created on first use
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+_supabase = None
+
+def session_key(session_id):
+    return f"chat:{session_id}"
+
+def history_key(session_id):
+    return f"history:{session_id}"
+
+async def send_validation_turn(session_id, query):
+    """Send one turn on a shared conversation and save its history.
+
+    Turns on the same conversation are serialized across workers by the
+    state backend lock.
+    """
+    key = session_key(session_id)
+    async with state.lock(key):
+        session = models.start_chat(VALIDATION_MODEL, history=await state.get(key))
+        response = await models.send_message(session, query, VALIDATION_MODEL)
+        await state.set(key, session.history, ttl=SESSION_TTL)
+    return session, response
+
+async def finish_conversation(session_id, session):
+    """Start the conversation over, unless another turn has been added since"""
+    key = session_key(session_id)
+    async with state.lock(key):
+        stored = await state.get(key)
+        if stored is not None and len(stored) == len(session.history):
+            await state.delete(key)
+
+async def load_sufficient_history(session_id):
+    """Return the session's most recent sufficient conversation history, if any"""
+    history = await state.get(history_key(session_id))
+    if not history:
+        logger.error("No sufficient history found for session %s", session_id)
+    return history
+
+async def get_cached_result(name, history):
+    """Return a pipeline result previously computed for this conversation"""
+    result = await state.get(f"result:{name}:{content_hash(history)}")
+    record_cache(name, result is not None)
+    return result
+
+async def cache_result(name, history, result):
+    if RESULT_CACHE_TTL > 0:
+        await state.set(f"result:{name}:{content_hash(history)}", result, ttl=RESULT_CACHE_TTL)
+
+def get_supabase():
+    """Return the Supabase client, importing and creating it on first use"""
+    global _supabase
+    if _supabase is None:
+        from supabase import create_client
+        _supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _supabase
+
+async def search_serp(params):
+    """Query SerpAPI in a worker thread, through the cassette if one is active"""
+    def fetch():
+        response = requests.get(SERPAPI_URL, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    with upstream_timer("serpapi", "search"):
+        if cassette is None:
+            return await asyncio.to_thread(fetch)
+        request = {k: v for k, v in params.items() if k != "api_key"}
+        return await cassette.play("serpapi", request, lambda: asyncio.to_thread(fetch))
+
+async def fetch_investors():
+    """Fetch the investor list from Supabase, through the cassette if one is active"""
+    def fetch():
+        return get_supabase().table('investor_list').select("*").execute().data
+
+    with upstream_timer("supabase", "investor_list"):
+        if cassette is None:
+            return await asyncio.to_thread(fetch)
+        return await cassette.play("supabase", {"table": "investor_list"}, lambda: asyncio.to_thread(fetch))
+
+def prewarm_clients():
+    """Import the Gemini and Supabase SDKs and build the validation models ahead of the first request"""
+    try:
+        # HTTP turns use VALIDATION_MODEL; /ws/validate streams on "chat"
+        for name in dict.fromkeys((VALIDATION_MODEL, "chat")):
+            models.get(name)
+        get_supabase()
+        logger.info("Prewarmed Gemini and Supabase clients")
+    except Exception as e:
+        logger.warning("Failed to prewarm clients: %s", e)
+
+def parse_validation_response(text):
+    """Extract the contemplator and final answer from a validation response"""
+    # Clean response text by removing code block markers and XML tags
+    cleaned_response = text.strip()
+    
+    # Remove XML code block markers if present
+    if cleaned_response.startswith('```xml'):
+        cleaned_response = cleaned_response[6:]
+    if cleaned_response.endswith('```'):
+        cleaned_response = cleaned_response[:-3]
+    cleaned_response = cleaned_response.strip()
+
+    # Extract contemplator content
+    contemplator_start = cleaned_response.find('<contemplator>') + len('<contemplator>')
+    contemplator_end = cleaned_response.find('</contemplator>')
+    if contemplator_end == -1:
+        logger.error("Could not find contemplator tags in response")
+        raise ValueError("Invalid response format: missing contemplator tags")
+    contemplator_content = cleaned_response[contemplator_start:contemplator_end].strip()
+
+    # Extract final answer content
+    final_answer_start = cleaned_response.find('<final_answer>') + len('<final_answer>')
+    final_answer_end = cleaned_response.find('</final_answer>')
+    if final_answer_end == -1:
+        logger.error("Could not find final_answer tags in response")
+        raise ValueError("Invalid response format: missing final_answer tags")
+    final_answer_text = cleaned_response[final_answer_start:final_answer_end].strip()
+
+    # Clean and parse the final answer JSON
+    final_answer_text = final_answer_text.replace('{{{{', '{').replace('}}}}', '}')
+    
+    try:
+        # First try direct JSON parsing
+        final_answer_json = json.loads(final_answer_text)
+    except json.JSONDecodeError:
+        logger.warning("Direct JSON parsing failed, attempting to extract JSON content")
+        # If direct parsing fails, try to extract status and response using string manipulation
+        try:
+            # Extract status
+            status_start = final_answer_text.find('"status":') + len('"status":')
+            if status_start == -1:
+                raise ValueError("Could not find status in response")
+            
+            # Find the next quote after status
+            status_content_start = final_answer_text.find('"', status_start)
+            status_content_end = final_answer_text.find('"', status_content_start + 1)
+            if status_content_start == -1 or status_content_end == -1:
+                # Try without quotes
+                status_end = final_answer_text.find(',', status_start)
+                if status_end == -1:
+                    status_end = final_answer_text.find('\n', status_start)
+                if status_end == -1:
+                    raise ValueError("Could not find end of status")
+                status = final_answer_text[status_start:status_end].strip()
+            else:
+                status = final_answer_text[status_content_start + 1:status_content_end].strip()
+            
+            # Extract response
+            response_start = final_answer_text.find('"response":') + len('"response":')
+            if response_start == -1:
+                raise ValueError("Could not find response in final answer")
+            
+            # Find the next quote after response
+            response_content_start = final_answer_text.find('"', response_start)
+            if response_content_start == -1:
+                # If no quotes, take everything after "response:" until the end or next field
+                response_content = final_answer_text[response_start:].strip()
+                # Remove trailing XML tags if present
+                if "</final_answer>" in response_content:
+                    response_content = response_content[:response_content.find("</final_answer>")].strip()
+            else:
+                # Find matching end quote, handling escaped quotes
+                pos = response_content_start + 1
+                while pos < len(final_answer_text):
+                    if final_answer_text[pos] == '"' and final_answer_text[pos-1] != '\\':
+                        break
+                    pos += 1
+                if pos >= len(final_answer_text):
+                    raise ValueError("Could not find end of response content")
+                response_content = final_answer_text[response_content_start + 1:pos]
+            
+            final_answer_json = {
+                "status": status,
+                "response": response_content
+            }
+        except Exception as e:
+            logger.error("Failed to extract JSON content: %s", e)
+            raise ValueError(f"Could not parse response content: {str(e)}")
+
+    # Build result
+    return {
+        "status": str(final_answer_json.get("status", "error")),
+        "contemplator": contemplator_content,
+        "result": final_answer_json.get("response", "No response generated")
+    }
+
+def parse_structured_validation(text):
+    """Read a schema-constrained validation response"""
+    data = json.loads(text)
+    if not isinstance(data, dict) or "status" not in data or "response" not in data:
+        raise ValueError("Invalid response format: missing status or response")
+    return {
+        "status": str(data["status"]),
+        "contemplator": str(data.get("contemplator", "")).strip(),
+        "result": data["response"]
+    }
+
+def read_validation_response(text, structured=STRUCTURED_VALIDATION):
+    """Parse a validation response, using the XML scanner only if structured output did not parse"""
+    if structured:
+        try:
+            result = parse_structured_validation(text)
+            record_validation_parse("structured", "ok")
+            return result
+        except (ValueError, TypeError) as e:
+            logger.warning("Structured validation response did not parse, trying XML format: %s", e)
+
+    mode = "structured" if structured else "xml"
+    try:
+        result = parse_validation_response(text)
+    except Exception:
+        record_validation_parse(mode, "failed")
+        raise
+    record_validation_parse(mode, "fallback" if structured else "ok")
+    return result
+
+async def store_sufficient_history(session_id, session):
+    """Keep a finished validation conversation for the session's downstream pipeline"""
+    logger.info("Sufficient information received, storing chat history")
+    history = session.history.copy()
+    logger.debug("Copied chat history, length: %d", len(history))
+    await state.set(history_key(session_id), history, ttl=SESSION_TTL)
+
+async def screen_idea(idea):
+    """Validate one idea in a fresh one-shot session"""
+    response = await models.generate(VALIDATION_MODEL, validation_prompt() + "User Query: " + idea)
+    if not response.text:
+        raise ValueError("Empty response from model")
+    return read_validation_response(response.text)
+
+def format_event(event, data, sse):
+    """Encode one streamed event as a server-sent event or an NDJSON line"""
+    if sse:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps({"event": event, "data": data}) + "\n"
+
+def event_stream(events, sse):
+    return StreamingResponse(events, media_type="text/event-stream" if sse else "application/x-ndjson")
+
+async def stream_mvp(prompt, history, sse):
+    """Stream the MVP JSON, sending each top-level field as soon as it is complete"""
+    parser = JsonFieldParser()
+    mvp_json = {}
+    try:
+        async for text in models.stream_generate("mvp", prompt):
+            for name, value in parser.feed(text):
+                mvp_json[name] = value
+                yield format_event(name, value, sse)
+        if not parser.done:
+            raise ValueError("Invalid JSON response from MVP generation")
+        logger.info("Successfully streamed MVP response")
+        await cache_result("generate_mvp", history, mvp_json)
+        yield format_event("done", {}, sse)
+    except Exception as e:
+        logger.error("MVP generation failed: %s", e)
+        yield format_event("error", {"detail": f"Failed to generate MVP recommendations: {str(e)}"}, sse)
+
+async def replay_fields(result, sse):
+    for name, value in result.items():
+        yield format_event(name, value, sse)
+    yield format_event("done", {}, sse)
+
+INVESTOR_COUNT = 3
+
+async def select_investors(conversation_text, investors_data):
+    """Pick the best-suited investors with a short structured call"""
+    prompt = f"""Based on the following startup conversation and investor database, select the top {INVESTOR_COUNT} most suitable investors.
+
+Startup Conversation:
+{conversation_text}
+
+Investor Database:
+{json.dumps(investors_data, indent=2)}
+
+Requirements:
+1. Select exactly {INVESTOR_COUNT} investors whose investment focus and portfolio align best with this startup
+2. For each, give "index" (its 0-based position in the Investor Database list), "name", and a "summary" of who they are and why them (50 words)
+3. Order them from best to worst fit"""
+
+    response = await models.generate("investor", prompt)
+    if not response.text:
+        raise ValueError("Empty response from model")
+    selected = json.loads(response.text).get("investors", [])[:INVESTOR_COUNT]
+    if not selected:
+        raise ValueError("No investors selected")
+    logger.info("Selected investors: %s", [investor.get('name') for investor in selected])
+    return selected
+
+async def draft_investor_email(conversation_text, investor, investors_data):
+    """Write the pitch email for one selected investor"""
+    index = investor.get("index")
+    if isinstance(index, int) and 0 <= index < len(investors_data):
+        record = investors_data[index]
+    else:
+        record = {"name": investor.get("name")}
+
+    prompt = f"""Write a personalized email pitching this startup to the investor below.
+
+Startup Conversation:
+{conversation_text}
+
+Investor:
+{json.dumps(record, indent=2)}
+
+Why this investor: {investor.get("summary", "")}
+
+Requirements:
+- Reference their specific investment history
+- Connect the startup to their investment thesis
+- Highlight relevant market opportunities
+- Keep it concise (100-200 words)
+- Return only the email text"""
+
+    response = await models.generate("investor_email", prompt)
+    if not response.text:
+        raise ValueError("Empty email response from model")
+    return response.text.strip()
+
+async def stream_investor_recommendations(conversation_text, investors_data, history, sse):
+    """Send the selected investors, then each email as soon as it is drafted"""
+    tasks = []
+    try:
+        selected = await select_investors(conversation_text, investors_data)
+        yield format_event("investors", [investor["summary"] for investor in selected], sse)
+
+        async def draft(i, investor):
+            return i, await draft_investor_email(conversation_text, investor, investors_data)
+
+        tasks = [asyncio.ensure_future(draft(i, investor)) for i, investor in enumerate(selected)]
+        emails = [None] * len(tasks)
+        for next_email in asyncio.as_completed(tasks):
+            i, email = await next_email
+            emails[i] = email
+            yield format_event("email", {"index": i, "email": email}, sse)
+
+        logger.info("Successfully streamed investor recommendations")
+        recommendations = {"investors": [investor["summary"] for investor in selected], "emails": emails}
+        await cache_result("investor_recommendations", history, recommendations)
+        yield format_event("done", {}, sse)
+    except Exception as e:
+        logger.error("Failed to generate recommendations: %s", e)
+        yield format_event("error", {"detail": str(e)}, sse)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def replay_investor_recommendations(recommendations, sse):
+    yield format_event("investors", recommendations["investors"], sse)
+    for i, email in enumerate(recommendations["emails"]):
+        yield format_event("email", {"index": i, "email": email}, sse)
+    yield format_event("done", {}, sse)
+
+async def transcribe_audio(audio_url):
+    """Download an audio file, upload it to Gemini and return its transcription"""
+    # Create a unique filename for the audio
+    audio_filename = f"audio_{int(time.time())}_{uuid.uuid4().hex[:8]}.wav"
+    audio_path = os.path.join(AUDIO_DIR, audio_filename)
+
+    # Download the audio file from Supabase
+    try:
+        with upstream_timer("supabase", "audio_download"):
+            response = await asyncio.to_thread(requests.get, audio_url)
+            response.raise_for_status()
+
+        with open(audio_path, "wb") as f:
+            f.write(response.content)
+        logger.info("Successfully downloaded audio to %s", audio_path)
+    except Exception as e:
+        logger.error("Failed to download audio: %s", e)
+        raise HTTPException(status_code=500, detail=f"Failed to download audio: {str(e)}")
+
+    try:
+        # Upload the audio file to Gemini
+        with upstream_timer("gemini", "upload_file"):
+            audio_file = await models.in_thread(models.upload_file, audio_path, mime_type="audio/wav")
+        logger.info("Successfully uploaded audio to Gemini")
+
+        # Get a transcription using a one-off request
+        transcription_response = await models.generate("transcription", [
+            "Please provide a precise, word-for-word transcription of this audio. Include only the transcription, no commentary or analysis.",
+            audio_file
+        ])
+
+        if not transcription_response.text:
+            logger.error("Empty transcription response")
+            raise HTTPException(status_code=500, detail="Failed to transcribe audio")
+
+        logger.info("Successfully transcribed audio")
+        return transcription_response.text
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Gemini processing error: %s", e)
+        raise HTTPException(status_code=500, detail=f"Failed to process audio with Gemini: {str(e)}")
+    finally:
+        # Clean up audio file
+        try:
+            if os.path.exists(audio_path):
+                os.remove(audio_path)
+                logger.info("Cleaned up audio file: %s", audio_path)
+        except Exception as e:
+            logger.warning("Failed to clean up audio file: %s", e)
 
 @app.get("/")
 async def hello_world():
     return {"message": "Hello World"}
 
 @app.get("/validate_idea")
-async def validate_startup_idea(idea: str):
+async def validate_startup_idea(idea: str, session_id: str = DEFAULT_SESSION_ID):
     try:
-        global chat, latest_sufficient_history
-        
-        logger.info(f"Processing idea validation request")
+        logger.info("Processing idea validation request")
         
         # Using double curly braces to escape JSON formatting
-        response = chat.send_message(prompt + "User Query: " + idea)
+        session, response = await send_validation_turn(session_id, validation_prompt() + "User Query: " + idea)
         
         if not response.text:
             logger.error("Empty response from model")
             raise HTTPException(status_code=500, detail="Failed to generate response")
 
         try:
-            # Clean response text by removing code block markers and XML tags
-            cleaned_response = response.text.strip()
-            
-            # Remove XML code block markers if present
-            if cleaned_response.startswith('```xml'):
-                cleaned_response = cleaned_response[6:]
-            if cleaned_response.endswith('```'):
-                cleaned_response = cleaned_response[:-3]
-            cleaned_response = cleaned_response.strip()
-
-            # Extract contemplator content
-            contemplator_start = cleaned_response.find('<contemplator>') + len('<contemplator>')
-            contemplator_end = cleaned_response.find('</contemplator>')
-            if contemplator_end == -1:
-                logger.error("Could not find contemplator tags in response")
-                raise ValueError("Invalid response format: missing contemplator tags")
-            contemplator_content = cleaned_response[contemplator_start:contemplator_end].strip()
-
-            # Extract final answer content
-            final_answer_start = cleaned_response.find('<final_answer>') + len('<final_answer>')
-            final_answer_end = cleaned_response.find('</final_answer>')
-            if final_answer_end == -1:
-                logger.error("Could not find final_answer tags in response")
-                raise ValueError("Invalid response format: missing final_answer tags")
-            final_answer_text = cleaned_response[final_answer_start:final_answer_end].strip()
-
-            # Clean and parse the final answer JSON
-            final_answer_text = final_answer_text.replace('{{{{', '{').replace('}}}}', '}')
-            
-            try:
-                # First try direct JSON parsing
-                final_answer_json = json.loads(final_answer_text)
-            except json.JSONDecodeError:
-                logger.warning("Direct JSON parsing failed, attempting to extract JSON content")
-                # If direct parsing fails, try to extract status and response using string manipulation
-                try:
-                    # Extract status
-                    status_start = final_answer_text.find('"status":') + len('"status":')
-                    if status_start == -1:
-                        raise ValueError("Could not find status in response")
-                    
-                    # Find the next quote after status
-                    status_content_start = final_answer_text.find('"', status_start)
-                    status_content_end = final_answer_text.find('"', status_content_start + 1)
-                    if status_content_start == -1 or status_content_end == -1:
-                        # Try without quotes
-                        status_end = final_answer_text.find(',', status_start)
-                        if status_end == -1:
-                            status_end = final_answer_text.find('\n', status_start)
-                        if status_end == -1:
-                            raise ValueError("Could not find end of status")
-                        status = final_answer_text[status_start:status_end].strip()
-                    else:
-                        status = final_answer_text[status_content_start + 1:status_content_end].strip()
-                    
-                    # Extract response
-                    response_start = final_answer_text.find('"response":') + len('"response":')
-                    if response_start == -1:
-                        raise ValueError("Could not find response in final answer")
-                    
-                    # Find the next quote after response
-                    response_content_start = final_answer_text.find('"', response_start)
-                    if response_content_start == -1:
-                        # If no quotes, take everything after "response:" until the end or next field
-                        response_content = final_answer_text[response_start:].strip()
-                        # Remove trailing XML tags if present
-                        if "</final_answer>" in response_content:
-                            response_content = response_content[:response_content.find("</final_answer>")].strip()
-                    else:
-                        # Find matching end quote, handling escaped quotes
-                        pos = response_content_start + 1
-                        while pos < len(final_answer_text):
-                            if final_answer_text[pos] == '"' and final_answer_text[pos-1] != '\\':
-                                break
-                            pos += 1
-                        if pos >= len(final_answer_text):
-                            raise ValueError("Could not find end of response content")
-                        response_content = final_answer_text[response_content_start + 1:pos]
-                    
-                    final_answer_json = {
-                        "status": status,
-                        "response": response_content
-                    }
-                except Exception as e:
-                    logger.error(f"Failed to extract JSON content: {str(e)}")
-                    raise ValueError(f"Could not parse response content: {str(e)}")
-
-            # Build result
-            result = {
-                "status": str(final_answer_json.get("status", "error")),
-                "contemplator": contemplator_content,
-                "result": final_answer_json.get("response", "No response generated")
-            }
+            result = read_validation_response(response.text)
 
             # Store history if we have sufficient information before resetting
             if result["status"] == "sufficient_information":
-                logger.info("Sufficient information received, storing chat history")
-                logger.info(f"Current chat history type: {type(chat.history)}, Length: {len(chat.history) if chat.history else 0}")
-                latest_sufficient_history = chat.history.copy()
-                logger.info(f"Copied history type: {type(latest_sufficient_history)}, Length: {len(latest_sufficient_history) if latest_sufficient_history else 0}")
-                # Save history to file
-                save_chat_history(latest_sufficient_history)
-                chat = model.start_chat(history=[])
+                await store_sufficient_history(session_id, session)
+                await finish_conversation(session_id, session)
 
             # Log current chat history state
-            logger.info("Current chat history state at end of validation:")
-            logger.info(f"Chat history type: {type(chat.history)}")
-            logger.info(f"Chat history length: {len(chat.history) if chat.history else 0}")
-            if chat.history:
-                for i, msg in enumerate(chat.history):
-                    logger.info(f"Message {i + 1}:")
-                    logger.info(f"  Parts: {len(msg.parts) if hasattr(msg, 'parts') else 'No parts'}")
-                    if hasattr(msg, 'parts'):
-                        for j, part in enumerate(msg.parts):
-                            logger.info(f"    Part {j + 1}: {str(part)[:100]}...")
+            logger.info("Chat history length at end of validation: %d", len(session.history))
+            if logger.isEnabledFor(logging.DEBUG) and should_sample():
+                log_chat_history(session.history)
 
             return result
 
         except Exception as parse_error:
             # Detailed error diagnostics
-            logger.error(f"Parse error: {str(parse_error)}")
+            logger.error("Parse error: %s", parse_error)
             error_info = {
                 "error_type": type(parse_error).__name__,
                 "message": str(parse_error),
@@ -338,19 +645,109 @@ async def validate_startup_idea(idea: str):
             raise HTTPException(status_code=422, detail=error_info)
             
     except Exception as e:
-        logger.error(f"Validation error: {str(e)}")
+        logger.error("Validation error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+class BatchRequest(BaseModel):
+    ideas: list[str]
+    concurrency: int | None = None
+
+@app.post("/validate_batch")
+async def validate_batch(request: BatchRequest):
+    """Screen many ideas independently, streaming one NDJSON line per idea as it completes.
+
+    Each line is {"index", "status", "contemplator", "result"} or
+    {"index", "error"}; a final {"done", "total", "failed"} line ends the stream.
+    """
+    if not request.ideas:
+        raise HTTPException(status_code=400, detail="No ideas provided")
+    if len(request.ideas) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ITEMS} ideas per batch")
+
+    concurrency = max(1, min(request.concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+    logger.info("Screening batch of %s ideas with concurrency %s", len(request.ideas), concurrency)
+
+    async def lines():
+        failed = 0
+        async for index, result, error in run_batch(request.ideas, screen_idea, concurrency, batch_limiter):
+            if error is None:
+                line = {"index": index, **result}
+            else:
+                failed += 1
+                logger.error("Batch item %s failed: %s", index, error)
+                line = {"index": index, "error": {"error_type": type(error).__name__, "message": str(error)}}
+            yield json.dumps(line) + "\n"
+        logger.info("Batch finished: %s succeeded, %s failed", len(request.ideas) - failed, failed)
+        yield json.dumps({"done": True, "total": len(request.ideas), "failed": failed}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.websocket("/ws/validate")
+async def validate_idea_ws(websocket: WebSocket, session_id: str = DEFAULT_SESSION_ID):
+    """Multi-turn idea validation over one connection, with streamed model output.
+
+    Each client message is {"type": "text", "text": ...} or
+    {"type": "audio", "audio_url": ...}. For every turn the server sends a
+    "transcript" message (audio turns only), "token" messages as the model
+    generates, then a "result" message shaped like /validate_idea's response,
+    or an "error" message. Sufficient conversations are stored under the
+    session_id query parameter for the downstream endpoints.
+    """
+    await websocket.accept()
+    session = models.start_chat()
+    logger.info("Validation WebSocket opened")
+
+    try:
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            try:
+                try:
+                    message = json.loads(frame.get("text") or frame.get("bytes") or "")
+                except ValueError:
+                    raise ValueError("Messages must be JSON objects")
+                if not isinstance(message, dict):
+                    raise ValueError("Messages must be JSON objects")
+
+                message_type = message.get("type")
+                if message_type == "audio" and message.get("audio_url"):
+                    transcription = await transcribe_audio(message["audio_url"])
+                    await websocket.send_json({"type": "transcript", "text": transcription})
+                    query = get_prompt() + "\nUser Query: " + transcription
+                elif message_type == "text" and message.get("text"):
+                    query = get_prompt() + "User Query: " + message["text"]
+                else:
+                    raise ValueError('Expected {"type": "text", "text": ...} or {"type": "audio", "audio_url": ...}')
+
+                chunks = []
+                async for chunk in models.stream_message(session, query):
+                    chunks.append(chunk)
+                    await websocket.send_json({"type": "token", "text": chunk})
+
+                # Streamed turns keep the XML format so tokens render as readable text
+                result = read_validation_response("".join(chunks), structured=False)
+                if result["status"] == "sufficient_information":
+                    await store_sufficient_history(session_id, session)
+                    session = models.start_chat()
+
+                await websocket.send_json({"type": "result", **result})
+            except WebSocketDisconnect:
+                raise
+            except HTTPException as e:
+                await websocket.send_json({"type": "error", "detail": e.detail})
+            except Exception as e:
+                logger.error("WebSocket validation error: %s", e)
+                await websocket.send_json({"type": "error", "detail": str(e)})
+    except WebSocketDisconnect:
+        logger.info("Validation WebSocket closed")
+
 @app.get("/market_analysis")
-async def market_analysis():
+async def market_analysis(session_id: str = DEFAULT_SESSION_ID):
     try:
-        global latest_sufficient_history
-        
         logger.info("Starting market analysis")
         
-        # Try to load history from file if not in memory
-        if not latest_sufficient_history:
-            latest_sufficient_history = load_chat_history()
+        latest_sufficient_history = await load_sufficient_history(session_id)
         
         # Check if we have stored sufficient history
         if not latest_sufficient_history:
@@ -359,44 +756,49 @@ async def market_analysis():
                 status_code=400,
                 detail="No sufficient conversation history available for analysis. Please complete the idea validation first."
             )
+
+        cached = await get_cached_result("market_analysis", latest_sufficient_history)
+        if cached is not None:
+            logger.info("Returning cached market analysis")
+            return cached
             
-        # Convert history to text format
-        try:
-            conversation_messages = []
-            for msg in latest_sufficient_history:
-                # Safely extract message parts
-                parts = getattr(msg, 'parts', [])
-                if len(parts) >= 2:  # Ensure we have both user and assistant parts
-                    user_text = parts[0].text if hasattr(parts[0], 'text') else str(parts[0])
-                    assistant_text = parts[1].text if hasattr(parts[1], 'text') else str(parts[1])
-                    conversation_messages.append(f"User: {user_text}\nAssistant: {assistant_text}")
-                else:
-                    # If message format is different, try to extract text safely
-                    msg_text = str(msg)
-                    conversation_messages.append(msg_text)
+        with stage_timer("market_analysis", "history"):
+            # Convert history to text format
+            try:
+                conversation_messages = []
+                for msg in latest_sufficient_history:
+                    # Safely extract message parts
+                    parts = getattr(msg, 'parts', [])
+                    if len(parts) >= 2:  # Ensure we have both user and assistant parts
+                        user_text = parts[0].text if hasattr(parts[0], 'text') else str(parts[0])
+                        assistant_text = parts[1].text if hasattr(parts[1], 'text') else str(parts[1])
+                        conversation_messages.append(f"User: {user_text}\nAssistant: {assistant_text}")
+                    else:
+                        # If message format is different, try to extract text safely
+                        msg_text = str(msg)
+                        conversation_messages.append(msg_text)
             
-            conversation_text = "\n".join(conversation_messages)
-            logger.info("Successfully processed conversation history")
-        except Exception as e:
-            logger.error(f"Failed to process conversation history: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Failed to process conversation history: {str(e)}")
+                conversation_text = "\n".join(conversation_messages)
+                logger.info("Successfully processed conversation history")
+            except Exception as e:
+                logger.error("Failed to process conversation history: %s", e)
+                raise HTTPException(status_code=500, detail=f"Failed to process conversation history: {str(e)}")
         
-        # Analyze conversation to understand the business
-        try:
-            logger.info("Analyzing conversation")
-            analysis = analysis_model.generate_content(f"Based on this conversation about a startup idea, analyze the core business concept and value proposition: {conversation_text}. NOTE: CUT STRAIGHT TO THE CHASE. DO NOT WASTE TIME. JUST GIVE THE FACTS. DO NOT MENTION THE USER'S IDEA. OR THIS INSTRUCTION. JUST GIVE THE FACTS.")
-            if not analysis.text:
-                logger.error("Empty analysis response")
-                raise ValueError("Failed to analyze conversation")
-            logger.info("Successfully generated analysis")
-        except Exception as e:
-            logger.error(f"Analysis failed: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Failed to analyze conversation: {str(e)}")
+        with stage_timer("market_analysis", "analysis"):
+            # Analyze conversation to understand the business
+            try:
+                logger.info("Analyzing conversation")
+                analysis = await models.generate("analysis", f"Based on this conversation about a startup idea, analyze the core business concept and value proposition: {conversation_text}. NOTE: CUT STRAIGHT TO THE CHASE. DO NOT WASTE TIME. JUST GIVE THE FACTS. DO NOT MENTION THE USER'S IDEA. OR THIS INSTRUCTION. JUST GIVE THE FACTS.")
+                if not analysis.text:
+                    logger.error("Empty analysis response")
+                    raise ValueError("Failed to analyze conversation")
+                logger.info("Successfully generated analysis")
+            except Exception as e:
+                logger.error("Analysis failed: %s", e)
+                raise HTTPException(status_code=500, detail=f"Failed to analyze conversation: {str(e)}")
 
         # Generate search queries
-        try:
-            logger.info("Generating search queries")
-            queries = searchquery_model.generate_content(f"""
+        query_prompt = f"""
 Based on this startup idea conversation and business analysis, generate EXACTLY 3 specific search queries that would help find direct competitors.
 Format the response as a valid Python list of strings. For example: ["query 1", "query 2", "query 3"]
 
@@ -413,118 +815,120 @@ Requirements:
 4. Format as a Python list of strings
 5. DO NOT include generic terms like "best" or "top" alone
 6. Each query should be 3-6 words long and highly specific
-""")
-            # Clean and parse the response
-            query_text = queries.text.strip()
-            logger.info(f"Raw query response: {query_text}")
+"""
+        with stage_timer("market_analysis", "query_generation"):
+            try:
+                logger.info("Generating search queries")
+                queries = await models.generate("searchquery", query_prompt)
+                # Clean and parse the response
+                query_text = queries.text.strip()
+                logger.info("Raw query response: %s", query_text)
             
-            # Remove any code block markers
-            query_text = query_text.replace("```python", "").replace("```", "").strip()
-            logger.info(f"Cleaned query text: {query_text}")
+                # Remove any code block markers
+                query_text = query_text.replace("```python", "").replace("```", "").strip()
+                logger.info("Cleaned query text: %s", query_text)
             
-            try:
-                # First try direct eval of the list
-                cleaned_queries = eval(query_text)
-                logger.info(f"Successfully evaluated query text as list: {cleaned_queries}")
-            except Exception as eval_error:
-                logger.warning(f"Failed to eval query text: {str(eval_error)}")
-                # If that fails, try to parse it manually
-                query_text = query_text.replace("[", "").replace("]", "")
-                cleaned_queries = [q.strip().strip('"\'') for q in query_text.split(",") if q.strip()]
-                logger.info(f"Manually parsed queries: {cleaned_queries}")
+                try:
+                    # First try direct eval of the list
+                    cleaned_queries = eval(query_text)
+                    logger.info("Successfully evaluated query text as list: %s", cleaned_queries)
+                except Exception as eval_error:
+                    logger.warning("Failed to eval query text: %s", eval_error)
+                    # If that fails, try to parse it manually
+                    query_text = query_text.replace("[", "").replace("]", "")
+                    cleaned_queries = [q.strip().strip('"\'') for q in query_text.split(",") if q.strip()]
+                    logger.info("Manually parsed queries: %s", cleaned_queries)
             
-            # Ensure exactly 3 queries
-            if not cleaned_queries or not isinstance(cleaned_queries, list):
-                logger.error("Invalid search queries generated")
-                raise ValueError("Failed to generate valid search queries")
+                # Ensure exactly 3 queries
+                if not cleaned_queries or not isinstance(cleaned_queries, list):
+                    logger.error("Invalid search queries generated")
+                    raise ValueError("Failed to generate valid search queries")
             
-            # Take only first 3 queries if more were generated
-            if len(cleaned_queries) > 3:
-                logger.warning(f"More than 3 queries generated ({len(cleaned_queries)}), truncating to first 3")
-                cleaned_queries = cleaned_queries[:3]
+                # Take only first 3 queries if more were generated
+                if len(cleaned_queries) > 3:
+                    logger.warning("More than 3 queries generated (%s), truncating to first 3", len(cleaned_queries))
+                    cleaned_queries = cleaned_queries[:3]
             
-            # If less than 3 queries, add generic ones based on analysis
-            if len(cleaned_queries) < 3:
-                logger.warning(f"Less than 3 queries generated ({len(cleaned_queries)}), adding generic queries")
-                while len(cleaned_queries) < 3:
-                    generic_query = f"competitors {analysis.text[:50]}"
-                    cleaned_queries.append(generic_query)
-                    logger.info(f"Added generic query: {generic_query}")
+                # If less than 3 queries, add generic ones based on analysis
+                if len(cleaned_queries) < 3:
+                    logger.warning("Less than 3 queries generated (%s), adding generic queries", len(cleaned_queries))
+                    while len(cleaned_queries) < 3:
+                        generic_query = f"competitors {analysis.text[:50]}"
+                        cleaned_queries.append(generic_query)
+                        logger.info("Added generic query: %s", generic_query)
             
-            # Ensure all queries are strings and non-empty
-            cleaned_queries = [str(q) for q in cleaned_queries if q]
+                # Ensure all queries are strings and non-empty
+                cleaned_queries = [str(q) for q in cleaned_queries if q]
             
-            logger.info(f"Final search queries ({len(cleaned_queries)}):")
-            for i, query in enumerate(cleaned_queries, 1):
-                logger.info(f"Query {i}: {query}")
+                logger.info("Final search queries (%s):", len(cleaned_queries))
+                for i, query in enumerate(cleaned_queries, 1):
+                    logger.info("Query %s: %s", i, query)
                 
-        except Exception as e:
-            logger.error(f"Query generation failed: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Failed to generate search queries: {str(e)}")
+            except Exception as e:
+                logger.error("Query generation failed: %s", e)
+                raise HTTPException(status_code=500, detail=f"Failed to generate search queries: {str(e)}")
 
         # Search for competitors
-        setofresults = []
-        try:
-            logger.info("Starting competitor search")
+        with stage_timer("market_analysis", "competitor_search"):
+            setofresults = []
+            try:
+                logger.info("Starting competitor search")
             
-            for i, q in enumerate(cleaned_queries):
-                logger.info(f"Executing search query {i+1}/{len(cleaned_queries)}: '{q}'")
+                for i, q in enumerate(cleaned_queries):
+                    logger.info("Executing search query %s/%s: '%s'", i+1, len(cleaned_queries), q)
                 
-                try:
-                    params = {
-                        "api_key": os.getenv("SERPAPI_KEY"),
-                        "engine": "google",
-                        "q": q,
-                        "google_domain": "google.com",
-                        "gl": "us",
-                        "hl": "en",
-                    }
-                    logger.info(f"SERP API request parameters for query {i+1}: {params}")
-                    
-                    # Make request to SERPAPI
-                    response = requests.get("https://serpapi.com/search", params=params)
-                    response.raise_for_status()
+                    try:
+                        params = {
+                            "api_key": os.getenv("SERPAPI_KEY"),
+                            "engine": "google",
+                            "q": q,
+                            "google_domain": "google.com",
+                            "gl": "us",
+                            "hl": "en",
+                        }
+                        logger.debug("SERP API request for query %d: q=%r", i + 1, q)
                     
-                    results = response.json()
-                    logger.info(f"SERP API response received for query {i+1}")
+                        # Make request to SERPAPI
+                        results = await search_serp(params)
+                        logger.info("SERP API response received for query %s", i+1)
                     
-                    # Extract organic results
-                    if "organic_results" in results:
-                        organic = results["organic_results"][:20]  # Get top 20 results
-                        logger.info(f"Found {len(organic)} organic results for query {i+1}")
+                        # Extract organic results
+                        if "organic_results" in results:
+                            organic = results["organic_results"][:20]  # Get top 20 results
+                            logger.info("Found %s organic results for query %s", len(organic), i+1)
                         
-                        record = []
-                        for j, entry in enumerate(organic, 1):
-                            if entry.get("title") and entry.get("link"):
-                                record.append({
-                                    "title": entry["title"],
-                                    "link": entry["link"],
-                                    "snippet": entry.get("snippet", "")
-                                })
-                                logger.debug(f"Query {i+1}, Result {j}: {entry['title']}")
+                            record = []
+                            for j, entry in enumerate(organic, 1):
+                                if entry.get("title") and entry.get("link"):
+                                    record.append({
+                                        "title": entry["title"],
+                                        "link": entry["link"],
+                                        "snippet": entry.get("snippet", "")
+                                    })
+                                    logger.debug("Query %d, Result %d: %s", i + 1, j, entry['title'])
                                 
-                        if record:
-                            setofresults.append(record)
-                            logger.info(f"Successfully processed query {i+1} with {len(record)} valid results")
+                            if record:
+                                setofresults.append(record)
+                                logger.info("Successfully processed query %s with %s valid results", i+1, len(record))
+                            else:
+                                logger.warning("No valid results found for query %s", i+1)
                         else:
-                            logger.warning(f"No valid results found for query {i+1}")
-                    else:
-                        logger.warning(f"No organic results found for query {i+1}")
+                            logger.warning("No organic results found for query %s", i+1)
                     
-                    # Add a small delay between requests
-                    logger.info(f"Adding delay after query {i+1}")
-                    time.sleep(1)
+                        # Add a small delay between requests
+                        logger.info("Adding delay after query %s", i+1)
+                        await asyncio.sleep(1)
                     
-                except requests.exceptions.RequestException as e:
-                    logger.error(f"Request failed for query {i+1}: {str(e)}")
-                    continue
-                except Exception as e:
-                    logger.error(f"Unexpected error processing query {i+1}: {str(e)}")
-                    continue
+                    except requests.exceptions.RequestException as e:
+                        logger.error("Request failed for query %s: %s", i+1, e)
+                        continue
+                    except Exception as e:
+                        logger.error("Unexpected error processing query %s: %s", i+1, e)
+                        continue
                 
-        except Exception as e:
-            logger.error(f"Search failed: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Failed to search competitors: {str(e)}")
+            except Exception as e:
+                logger.error("Search failed: %s", e)
+                raise HTTPException(status_code=500, detail=f"Failed to search competitors: {str(e)}")
 
         # Check if we got any valid results
         if not setofresults:
@@ -538,11 +942,19 @@ Requirements:
         for result_set in setofresults:
             processed_results.extend(result_set)
         
-        logger.info(f"Completed competitor search with {len(processed_results)} total results")
+        logger.info("Completed competitor search with %s total results", len(processed_results))
+
+        # Summarize the top result domains' homepages; failures only drop that domain
+        homepages = []
+        if COMPETITOR_ENRICHMENT:
+            with stage_timer("market_analysis", "enrichment"):
+                try:
+                    homepages = await enricher.enrich([entry["link"] for entry in processed_results])
+                except Exception as e:
+                    logger.warning("Competitor enrichment failed: %s", e)
 
         # Find top competitors
-        logger.info("Identifying top competitors")
-        competitors = competitorfinder_model.generate_content(f"""
+        competitor_prompt = f"""
 Based on the following business analysis and search results, identify the top 3-5 DIRECT competitors. 
 Focus on companies that directly compete in the same space, not generic listings or articles.
 
@@ -552,6 +964,9 @@ Business Analysis:
 Search Results:
 {processed_results}
 
+Company Homepages (title, meta description and headings of the result domains):
+{json.dumps(homepages, indent=2) if homepages else "Not available"}
+
 Requirements:
 1. Return a JSON object with this exact structure:
 {{
@@ -573,12 +988,15 @@ Requirements:
 Now use these core competitors to give the startup strategic advice on company building and growth. 
 Advise them on what they can do to set themselves apart from the competitors.
 NOTE: PRETEND THE MODEL'S RESULTS WERE YOUR OWN RESULTS. YOU ARE TALKING TO THE FOUNDER OF THE STARTUP. YOU ARE SPEAKING FOR ALL DATA YOU HAVE
-""")
-        if not competitors.text:
-            logger.error("Empty competitor analysis response")
-            raise ValueError("Failed to identify competitors")
-        top_competitors = json.loads(competitors.text)
-        logger.info("Successfully identified top competitors")
+"""
+        with stage_timer("market_analysis", "competitor_finder"):
+            logger.info("Identifying top competitors")
+            competitors = await models.generate("competitorfinder", competitor_prompt)
+            if not competitors.text:
+                logger.error("Empty competitor analysis response")
+                raise ValueError("Failed to identify competitors")
+            top_competitors = json.loads(competitors.text)
+            logger.info("Successfully identified top competitors")
 
         # Generate complete analysis
         complete_analysis = f"""
@@ -601,29 +1019,32 @@ Direct Competitors:
    Key Differentiators: {top_competitors.get('competitors', [])[2]['differentiators']}
 """
         logger.info("Market analysis completed successfully")
-        return {
+        result = {
             "analysis": complete_analysis
         }
+        await cache_result("market_analysis", latest_sufficient_history, result)
+        return result
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Unexpected error in market analysis: {str(e)}")
+        logger.error("Unexpected error in market analysis: %s", e)
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
 @app.get("/generate_mvp")
-async def generate_mvp():
+async def generate_mvp(session_id: str = DEFAULT_SESSION_ID, stream: bool = False, accept: str | None = Header(None)):
+    """Generate MVP recommendations.
+
+    With stream=true each top-level field is sent as an event as soon as it
+    is complete, then a "done" (or "error") event; SSE when the client
+    accepts text/event-stream, NDJSON otherwise.
+    """
+    sse = "text/event-stream" in (accept or "")
     try:
-        global latest_sufficient_history
-        
         logger.info("Starting MVP generation")
-        logger.info(f"Initial latest_sufficient_history state: {type(latest_sufficient_history) if latest_sufficient_history else 'None'}")
         
-        # Try to load history from file if not in memory
-        if not latest_sufficient_history:
-            logger.info("No history in memory, attempting to load from file")
-            latest_sufficient_history = load_chat_history()
-            logger.info(f"Loaded history state: {type(latest_sufficient_history) if latest_sufficient_history else 'None'}")
+        latest_sufficient_history = await load_sufficient_history(session_id)
+        logger.info("Loaded history state: %s", type(latest_sufficient_history) if latest_sufficient_history else 'None')
         
         # Check if we have stored sufficient history
         if not latest_sufficient_history:
@@ -632,6 +1053,11 @@ async def generate_mvp():
                 status_code=400,
                 detail="No sufficient conversation history available for MVP generation. Please complete the idea validation first."
             )
+
+        cached = await get_cached_result("generate_mvp", latest_sufficient_history)
+        if cached is not None:
+            logger.info("Returning cached MVP recommendations")
+            return event_stream(replay_fields(cached, sse), sse) if stream else cached
             
         # Convert history to text format
         try:
@@ -649,21 +1075,9 @@ async def generate_mvp():
             conversation_text = "\n".join(conversation_messages)
             logger.info("Successfully processed conversation history")
         except Exception as e:
-            logger.error(f"Failed to process conversation history: {str(e)}")
+            logger.error("Failed to process conversation history: %s", e)
             raise HTTPException(status_code=500, detail=f"Failed to process conversation history: {str(e)}")
 
-        # Initialize MVP generation model
-        mvp_model = genai.GenerativeModel(
-            model_name="gemini-2.0-flash",
-            generation_config={
-                "temperature": 0.9,
-                "top_p": 0.95,
-                "top_k": 40,
-                "max_output_tokens": 8192,
-                "response_mime_type": "application/json"
-            }
-        )
-
         # Generate MVP recommendations
         try:
             logger.info("Generating MVP recommendations")
@@ -713,7 +1127,10 @@ async def generate_mvp():
             3. Example format: "Component1 --> Component2 --> Component3"
             """
             
-            mvp_response = mvp_model.generate_content(mvp_prompt)
+            if stream:
+                return event_stream(stream_mvp(mvp_prompt, latest_sufficient_history, sse), sse)
+
+            mvp_response = await models.generate("mvp", mvp_prompt)
             if not mvp_response.text:
                 logger.error("Empty MVP response")
                 raise ValueError("Failed to generate MVP recommendations")
@@ -723,65 +1140,32 @@ async def generate_mvp():
             # Parse the response as JSON
             try:
                 mvp_json = json.loads(mvp_response.text)
+                await cache_result("generate_mvp", latest_sufficient_history, mvp_json)
                 return mvp_json
             except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse MVP response as JSON: {str(e)}")
+                logger.error("Failed to parse MVP response as JSON: %s", e)
                 raise ValueError("Invalid JSON response from MVP generation")
 
         except Exception as e:
-            logger.error(f"MVP generation failed: {str(e)}")
+            logger.error("MVP generation failed: %s", e)
             raise HTTPException(status_code=500, detail=f"Failed to generate MVP recommendations: {str(e)}")
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Unexpected error in MVP generation: {str(e)}")
+        logger.error("Unexpected error in MVP generation: %s", e)
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
 @app.get("/validate_audio")
-async def validate_audio_idea(audio_url: str):
+async def validate_audio_idea(audio_url: str, session_id: str = DEFAULT_SESSION_ID):
     try:
-        logger.info(f"Processing audio validation request for URL: {audio_url}")
-        
-        # Create a unique filename for the audio
-        audio_filename = f"audio_{int(time.time())}.wav"
-        audio_path = os.path.join(AUDIO_DIR, audio_filename)
-        
-        # Download the audio file from Supabase
-        try:
-            response = requests.get(audio_url)
-            response.raise_for_status()
-            
-            with open(audio_path, "wb") as f:
-                f.write(response.content)
-            logger.info(f"Successfully downloaded audio to {audio_path}")
-        except Exception as e:
-            logger.error(f"Failed to download audio: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Failed to download audio: {str(e)}")
-        
+        logger.info("Processing audio validation request for URL: %s", audio_url)
+
+        transcription = await transcribe_audio(audio_url)
+
         try:
-            # Upload the audio file to Gemini
-            audio_file = genai.upload_file(audio_path, mime_type="audio/wav")
-            logger.info(f"Successfully uploaded audio to Gemini")
-            
-            # First, get a transcription using a one-off request
-            transcription_model = genai.GenerativeModel('gemini-2.0-flash')
-            transcription_response = transcription_model.generate_content([
-                "Please provide a precise, word-for-word transcription of this audio. Include only the transcription, no commentary or analysis.",
-                audio_file
-            ])
-            
-            if not transcription_response.text:
-                logger.error("Empty transcription response")
-                raise HTTPException(status_code=500, detail="Failed to transcribe audio")
-                
-            logger.info("Successfully transcribed audio")
-            
-            # Use the global chat instance with the transcription
-            global chat, latest_sufficient_history
-            
             # Send the transcription as if it were text input
-            response = chat.send_message(prompt + "\nUser Query: " + transcription_response.text)
+            session, response = await send_validation_turn(session_id, validation_prompt() + "\nUser Query: " + transcription)
             
             if not response.text:
                 logger.error("Empty response from model")
@@ -789,96 +1173,17 @@ async def validate_audio_idea(audio_url: str):
             
             # Process the response similar to text validation
             try:
-                # Clean response text
-                cleaned_response = response.text.strip()
-                
-                # Remove XML code block markers if present
-                if cleaned_response.startswith('```xml'):
-                    cleaned_response = cleaned_response[6:]
-                if cleaned_response.endswith('```'):
-                    cleaned_response = cleaned_response[:-3]
-                cleaned_response = cleaned_response.strip()
-
-                # Extract contemplator content
-                contemplator_start = cleaned_response.find('<contemplator>') + len('<contemplator>')
-                contemplator_end = cleaned_response.find('</contemplator>')
-                if contemplator_end == -1:
-                    logger.error("Could not find contemplator tags in response")
-                    raise ValueError("Invalid response format: missing contemplator tags")
-                contemplator_content = cleaned_response[contemplator_start:contemplator_end].strip()
-
-                # Extract final answer content
-                final_answer_start = cleaned_response.find('<final_answer>') + len('<final_answer>')
-                final_answer_end = cleaned_response.find('</final_answer>')
-                if final_answer_end == -1:
-                    logger.error("Could not find final_answer tags in response")
-                    raise ValueError("Invalid response format: missing final_answer tags")
-                final_answer_text = cleaned_response[final_answer_start:final_answer_end].strip()
-
-                # Clean and parse the final answer JSON
-                final_answer_text = final_answer_text.replace('{{{{', '{').replace('}}}}', '}')
-                
-                try:
-                    final_answer_json = json.loads(final_answer_text)
-                except json.JSONDecodeError:
-                    logger.warning("Direct JSON parsing failed, attempting to extract JSON content")
-                    try:
-                        # Extract status and response using string manipulation
-                        status_start = final_answer_text.find('"status":') + len('"status":')
-                        status_content_start = final_answer_text.find('"', status_start)
-                        status_content_end = final_answer_text.find('"', status_content_start + 1)
-                        if status_content_start == -1 or status_content_end == -1:
-                            status_end = final_answer_text.find(',', status_start)
-                            if status_end == -1:
-                                status_end = final_answer_text.find('\n', status_start)
-                            if status_end == -1:
-                                raise ValueError("Could not find end of status")
-                            status = final_answer_text[status_start:status_end].strip()
-                        else:
-                            status = final_answer_text[status_content_start + 1:status_content_end].strip()
-                        
-                        response_start = final_answer_text.find('"response":') + len('"response":')
-                        response_content_start = final_answer_text.find('"', response_start)
-                        if response_content_start == -1:
-                            response_content = final_answer_text[response_start:].strip()
-                            if "</final_answer>" in response_content:
-                                response_content = response_content[:response_content.find("</final_answer>")].strip()
-                        else:
-                            pos = response_content_start + 1
-                            while pos < len(final_answer_text):
-                                if final_answer_text[pos] == '"' and final_answer_text[pos-1] != '\\':
-                                    break
-                                pos += 1
-                            if pos >= len(final_answer_text):
-                                raise ValueError("Could not find end of response content")
-                            response_content = final_answer_text[response_content_start + 1:pos]
-                        
-                        final_answer_json = {
-                            "status": status,
-                            "response": response_content
-                        }
-                    except Exception as e:
-                        logger.error(f"Failed to extract JSON content: {str(e)}")
-                        raise ValueError(f"Could not parse response content: {str(e)}")
-
-                # Build result
-                result = {
-                    "status": str(final_answer_json.get("status", "error")),
-                    "contemplator": contemplator_content,
-                    "result": final_answer_json.get("response", "No response generated")
-                }
+                result = read_validation_response(response.text)
 
                 # Store history if we have sufficient information
                 if result["status"] == "sufficient_information":
-                    logger.info("Sufficient information received, storing chat history")
-                    latest_sufficient_history = chat.history.copy()
-                    save_chat_history(latest_sufficient_history)
-                    chat = model.start_chat(history=[])
+                    await store_sufficient_history(session_id, session)
+                    await finish_conversation(session_id, session)
                 
                 return result
 
             except Exception as parse_error:
-                logger.error(f"Parse error: {str(parse_error)}")
+                logger.error("Parse error: %s", parse_error)
                 error_info = {
                     "error_type": type(parse_error).__name__,
                     "message": str(parse_error),
@@ -887,39 +1192,39 @@ async def validate_audio_idea(audio_url: str):
                 raise HTTPException(status_code=422, detail=error_info)
                 
         except Exception as e:
-            logger.error(f"Gemini processing error: {str(e)}")
+            logger.error("Gemini processing error: %s", e)
             raise HTTPException(status_code=500, detail=f"Failed to process audio with Gemini: {str(e)}")
-        finally:
-            # Clean up audio file
-            try:
-                if os.path.exists(audio_path):
-                    os.remove(audio_path)
-                    logger.info(f"Cleaned up audio file: {audio_path}")
-            except Exception as e:
-                logger.warning(f"Failed to clean up audio file: {str(e)}")
             
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Validation error: {str(e)}")
+        logger.error("Validation error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/investor_recommendations")
-async def get_investor_recommendations():
+async def get_investor_recommendations(session_id: str = DEFAULT_SESSION_ID, stream: bool = False,
+                                       accept: str | None = Header(None)):
+    """Recommend investors and draft a personalized email to each.
+
+    With stream=true an "investors" event is sent once they are selected, an
+    "email" event as each email finishes, then "done" (or "error").
+    """
+    sse = "text/event-stream" in (accept or "")
     try:
-        global latest_sufficient_history
-        
         logger.info("Starting investor recommendations")
         
-        # Try to load history if not in memory
-        if not latest_sufficient_history:
-            latest_sufficient_history = load_chat_history()
+        latest_sufficient_history = await load_sufficient_history(session_id)
             
         if not latest_sufficient_history:
             raise HTTPException(
                 status_code=400,
                 detail="No sufficient conversation history available. Please complete idea validation first."
             )
+
+        cached = await get_cached_result("investor_recommendations", latest_sufficient_history)
+        if cached is not None:
+            logger.info("Returning cached investor recommendations")
+            return event_stream(replay_investor_recommendations(cached, sse), sse) if stream else cached
         
         # Convert history to text
         conversation_text = ""
@@ -938,79 +1243,43 @@ async def get_investor_recommendations():
             conversation_text = "\n".join(conversation_messages)
             logger.info("Successfully processed conversation history")
         except Exception as e:
-            logger.error(f"Failed to process conversation history: {str(e)}")
+            logger.error("Failed to process conversation history: %s", e)
             raise HTTPException(status_code=500, detail=str(e))
 
         # Fetch investor list from Supabase
         try:
-            response = supabase.table('investor_list').select("*").execute()
-            investors_data = response.data
-            logger.info(f"Successfully fetched {len(investors_data)} investors from database")
+            investors_data = await fetch_investors()
+            logger.info("Successfully fetched %s investors from database", len(investors_data))
         except Exception as e:
-            logger.error(f"Failed to fetch investors: {str(e)}")
+            logger.error("Failed to fetch investors: %s", e)
             raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
-        # Initialize recommendation model
-        investor_model = genai.GenerativeModel(
-            model_name="gemini-2.0-flash",
-            generation_config={
-                "temperature": 0.7,
-                "top_p": 0.95,
-                "top_k": 40,
-                "max_output_tokens": 8192,
-                "response_mime_type": "application/json"
-            }
-        )
+        # Pick investors with one short call, then draft their emails concurrently
+        if stream:
+            return event_stream(
+                stream_investor_recommendations(conversation_text, investors_data, latest_sufficient_history, sse), sse
+            )
 
-        # Generate recommendations
         try:
-            prompt = f"""Based on the following startup conversation and investor database, recommend the top 3 most suitable investors and craft personalized email pitches.
-
-Startup Conversation:
-{conversation_text}
-
-Investor Database:
-{json.dumps(investors_data, indent=2)}
-
-Requirements:
-1. Select exactly 3 investors whose investment focus and portfolio align best with this startup
-2. For each investor, craft a personalized email that:
-   - References their specific investment history
-   - Connects the startup to their investment thesis
-   - Highlights relevant market opportunities
-   - Keeps emails concise (100-200 words)
-
-Return a JSON object with exactly this structure:
-{{
-    "investors": [
-        investor1 (who they are and why them, 50 words),
-        investor2 (who they are and why them, 50 words),
-        investor3 (who they are and why them, 50 words)
-    ],
-    "emails": [
-        email1,
-        email2,
-        email3
-    ]
-}}
-
-Ensure each email is unique and specifically tailored to the corresponding investor."""
-
-            response = investor_model.generate_content(prompt)
-            if not response.text:
-                raise ValueError("Empty response from model")
-
-            recommendations = json.loads(response.text)
+            selected = await select_investors(conversation_text, investors_data)
+            emails = await asyncio.gather(
+                *(draft_investor_email(conversation_text, investor, investors_data) for investor in selected)
+            )
+            recommendations = {
+                "investors": [investor["summary"] for investor in selected],
+                "emails": list(emails)
+            }
             logger.info("Successfully generated investor recommendations")
             
+            await cache_result("investor_recommendations", latest_sufficient_history, recommendations)
             return recommendations
 
         except Exception as e:
-            logger.error(f"Failed to generate recommendations: {str(e)}")
+            logger.error("Failed to generate recommendations: %s", e)
             raise HTTPException(status_code=500, detail=str(e))
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
+        logger.error("Unexpected error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
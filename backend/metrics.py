@@ -0,0 +1,174 @@
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from starlette.routing import Match
+
+# Buckets sized for LLM calls, which routinely take several seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128)
+
+REQUEST_LATENCY = Histogram(
+    "pathfinder_request_duration_seconds",
+    "End-to-end HTTP request latency",
+    ["endpoint", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+REQUESTS_IN_FLIGHT = Gauge(
+    "pathfinder_requests_in_flight",
+    "HTTP requests currently being handled",
+    ["endpoint"],
+)
+
+STAGE_LATENCY = Histogram(
+    "pathfinder_stage_duration_seconds",
+    "Latency of individual pipeline stages",
+    ["endpoint", "stage"],
+    buckets=LATENCY_BUCKETS,
+)
+
+UPSTREAM_LATENCY = Histogram(
+    "pathfinder_upstream_duration_seconds",
+    "Latency of calls to Gemini, SerpAPI and Supabase",
+    ["provider", "operation", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+
+UPSTREAM_IN_FLIGHT = Gauge(
+    "pathfinder_upstream_in_flight",
+    "Upstream calls currently waiting on a response",
+    ["provider", "operation"],
+)
+
+GEMINI_TOKENS = Counter(
+    "pathfinder_gemini_tokens_total",
+    "Tokens reported by Gemini usage_metadata",
+    ["model", "kind"],
+)
+
+CACHE_REQUESTS = Counter(
+    "pathfinder_cache_requests_total",
+    "Cache lookups by outcome",
+    ["cache", "result"],
+)
+
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "pathfinder_admission_queue_depth",
+    "Requests waiting for an admission slot",
+    ["endpoint"],
+)
+
+ADMISSION_REJECTIONS = Counter(
+    "pathfinder_admission_rejections_total",
+    "Requests shed with a 503 by admission control",
+    ["endpoint", "reason"],
+)
+
+VALIDATION_PARSES = Counter(
+    "pathfinder_validation_parse_total",
+    "Validation responses by output mode and parse outcome (ok, fallback, failed)",
+    ["mode", "outcome"],
+)
+
+
+@contextmanager
+def stage_timer(endpoint, stage):
+    """Time one stage of a request pipeline"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(endpoint, stage).observe(time.perf_counter() - start)
+
+
+@contextmanager
+def upstream_timer(provider, operation):
+    """Time a call to an upstream provider and track how many are outstanding"""
+    in_flight = UPSTREAM_IN_FLIGHT.labels(provider, operation)
+    in_flight.inc()
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        in_flight.dec()
+        UPSTREAM_LATENCY.labels(provider, operation, outcome).observe(time.perf_counter() - start)
+
+
+def record_token_usage(model, response):
+    """Add the token counts from a Gemini response to the token counter"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    for kind, field in (
+        ("prompt", "prompt_token_count"),
+        ("candidates", "candidates_token_count"),
+        ("total", "total_token_count"),
+    ):
+        count = getattr(usage, field, None)
+        if count:
+            GEMINI_TOKENS.labels(model, kind).inc(count)
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_validation_parse(mode, outcome):
+    VALIDATION_PARSES.labels(mode, outcome).inc()
+
+
+def route_label(app, scope):
+    """Return the route template for a request so metric labels stay bounded"""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware recording request latency and in-flight counts.
+
+    Timing stops once the last body chunk has been sent, so streamed
+    responses are measured end to end rather than up to their headers.
+    """
+
+    def __init__(self, app, root_app):
+        self.app = app
+        self.root_app = root_app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = route_label(self.root_app, scope)
+        in_flight = REQUESTS_IN_FLIGHT.labels(endpoint)
+        in_flight.inc()
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_flight.dec()
+            REQUEST_LATENCY.labels(endpoint, scope["method"], str(status)).observe(time.perf_counter() - start)
+
+
+def install(app):
+    """Add request instrumentation and the /metrics endpoint to an app"""
+    from fastapi import Response
+
+    app.add_middleware(RequestMetricsMiddleware, root_app=app)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,337 @@
+import asyncio
+import contextvars
+import copy
+import functools
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from cassettes import content_hash, decode_gemini_response, encode_gemini_response
+from metrics import record_token_usage, upstream_timer
+
+logger = logging.getLogger(__name__)
+
+# Generation configs shared by several models
+default_generation_config = {
+    "temperature": 1,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 8192,
+}
+
+structured_generation_config = {
+    **default_generation_config,
+    "response_mime_type": "application/json",
+}
+
+# Validation turns are constrained to this schema so every response parses as JSON
+validation_response_schema = {
+    "type": "object",
+    "properties": {
+        "contemplator": {"type": "string"},
+        "status": {"type": "string", "enum": ["insufficient_information", "sufficient_information"]},
+        "response": {"type": "string"},
+    },
+    "required": ["contemplator", "status", "response"],
+}
+
+# Investor selection returns short picks; the emails are drafted separately
+investor_selection_schema = {
+    "type": "object",
+    "properties": {
+        "investors": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "index": {"type": "integer"},
+                    "name": {"type": "string"},
+                    "summary": {"type": "string"},
+                },
+                "required": ["index", "name", "summary"],
+            },
+        },
+    },
+    "required": ["investors"],
+}
+
+# Built-in model routing. Each entry can be overridden without code changes,
+# either through the JSON file named by GEMINI_MODELS_CONFIG or by setting
+# GEMINI_MODEL_<NAME> (e.g. GEMINI_MODEL_SEARCHQUERY=gemini-2.0-flash).
+DEFAULT_MODEL_SPECS = {
+    "chat": {
+        "model_name": "gemini-2.0-flash",
+        "generation_config": None,
+        "max_concurrency": 8,
+    },
+    "validation": {
+        "model_name": "gemini-2.0-flash",
+        "generation_config": {
+            "response_mime_type": "application/json",
+            "response_schema": validation_response_schema,
+        },
+        "max_concurrency": 8,
+    },
+    "analysis": {
+        "model_name": "gemini-2.0-flash",
+        "generation_config": default_generation_config,
+        "max_concurrency": 4,
+    },
+    "searchquery": {
+        "model_name": "gemini-2.0-flash-lite",
+        "generation_config": default_generation_config,
+        "max_concurrency": 8,
+    },
+    "competitorfinder": {
+        "model_name": "gemini-2.0-flash",
+        "generation_config": structured_generation_config,
+        "max_concurrency": 4,
+    },
+    "mvp": {
+        "model_name": "gemini-2.0-flash",
+        "generation_config": {**structured_generation_config, "temperature": 0.9},
+        "max_concurrency": 4,
+    },
+    "investor": {
+        "model_name": "gemini-2.0-flash",
+        "generation_config": {
+            **structured_generation_config,
+            "temperature": 0.7,
+            "response_schema": investor_selection_schema,
+        },
+        "max_concurrency": 4,
+    },
+    "investor_email": {
+        "model_name": "gemini-2.0-flash",
+        "generation_config": {**default_generation_config, "temperature": 0.7, "max_output_tokens": 1024},
+        "max_concurrency": 12,
+    },
+    "transcription": {
+        "model_name": "gemini-2.0-flash-lite",
+        "generation_config": None,
+        "max_concurrency": 4,
+    },
+}
+
+
+def chunk_text(chunk):
+    """Text of a streamed response chunk; chunks without parts have none"""
+    try:
+        return chunk.text
+    except ValueError:
+        return ""
+
+
+def load_model_specs(config_path=None):
+    """Merge the built-in model specs with file and environment overrides"""
+    specs = copy.deepcopy(DEFAULT_MODEL_SPECS)
+
+    config_path = config_path or os.getenv("GEMINI_MODELS_CONFIG")
+    if config_path:
+        try:
+            with open(config_path) as f:
+                overrides = json.load(f)
+            for name, override in overrides.items():
+                specs.setdefault(name, {"model_name": "gemini-2.0-flash", "generation_config": None, "max_concurrency": 4})
+                specs[name].update(override)
+            logger.info("Loaded model overrides for %s models from %s", len(overrides), config_path)
+        except Exception as e:
+            logger.error("Failed to load model config from %s: %s", config_path, e)
+            raise
+
+    for name, spec in specs.items():
+        model_name = os.getenv(f"GEMINI_MODEL_{name.upper()}")
+        if model_name:
+            spec["model_name"] = model_name
+        concurrency = os.getenv(f"GEMINI_CONCURRENCY_{name.upper()}")
+        if concurrency:
+            spec["max_concurrency"] = int(concurrency)
+
+    return specs
+
+
+class ModelRegistry:
+    """Named, pre-built Gemini clients with per-model concurrency limits"""
+
+    def __init__(self, specs=None, cassette=None):
+        self.specs = specs if specs is not None else load_model_specs()
+        self.cassette = cassette
+        self._models = {}
+        self._semaphores = {}
+        self._lock = threading.Lock()
+        self._genai = None
+        self._executor = None
+
+    def genai(self):
+        """Import and configure the Gemini SDK on first use; importing it is slow"""
+        if self._genai is None:
+            with self._lock:
+                if self._genai is None:
+                    import google.generativeai as genai
+                    endpoint = os.getenv("GEMINI_API_ENDPOINT")
+                    if endpoint:
+                        # e.g. a local stand-in server for benchmarks
+                        genai.configure(
+                            api_key=os.getenv("GOOGLE_API_KEY"),
+                            transport="rest",
+                            client_options={"api_endpoint": endpoint},
+                        )
+                    else:
+                        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+                    self._genai = genai
+        return self._genai
+
+    def spec(self, name):
+        if name not in self.specs:
+            raise KeyError(f"Unknown model: {name}")
+        return self.specs[name]
+
+    def get(self, name):
+        """Return the client for a named model, building it on first use"""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        spec = self.spec(name)
+        genai = self.genai()
+        with self._lock:
+            if name not in self._models:
+                logger.info("Building model '%s' (%s)", name, spec['model_name'])
+                self._models[name] = genai.GenerativeModel(
+                    model_name=spec["model_name"],
+                    generation_config=spec.get("generation_config"),
+                )
+            return self._models[name]
+
+    def semaphore(self, name):
+        semaphore = self._semaphores.get(name)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.spec(name).get("max_concurrency", 4))
+            self._semaphores[name] = semaphore
+        return semaphore
+
+    def executor(self):
+        """Thread pool for blocking SDK calls, sized so every model can use its full concurrency"""
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    workers = sum(spec.get("max_concurrency", 4) for spec in self.specs.values())
+                    self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gemini")
+        return self._executor
+
+    async def in_thread(self, fn, *args, **kwargs):
+        """Run a blocking SDK call on the Gemini pool, keeping the default executor free"""
+        call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self.executor(), call)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def upload_file(self, path, **kwargs):
+        return self.genai().upload_file(path, **kwargs)
+
+    def start_chat(self, name="chat", history=None):
+        return self.get(name).start_chat(history=history or [])
+
+    async def run(self, name, contents, fn, *args, **kwargs):
+        """Run a blocking Gemini call on the Gemini pool under the model's concurrency limit"""
+        async with self.semaphore(name):
+            with upstream_timer("gemini", name):
+                if self.cassette is None:
+                    response = await self.in_thread(fn, *args, **kwargs)
+                else:
+                    response = await self.cassette.play(
+                        "gemini",
+                        self.cassette_request(name, contents),
+                        lambda: self.in_thread(fn, *args, **kwargs),
+                        encode_gemini_response,
+                        decode_gemini_response,
+                    )
+        record_token_usage(self.spec(name)["model_name"], response)
+        return response
+
+    def cassette_request(self, name, contents):
+        """Identify a Gemini call by model, prompt hash and generation config"""
+        spec = self.spec(name)
+        return {
+            "model": spec["model_name"],
+            "prompt_hash": content_hash(contents),
+            "generation_config": spec.get("generation_config"),
+        }
+
+    async def generate(self, name, contents, **kwargs):
+        return await self.run(name, contents, self.get(name).generate_content, contents, **kwargs)
+
+    async def send_message(self, chat, content, name="chat", **kwargs):
+        response = await self.run(name, [*chat.history, content], chat.send_message, content, **kwargs)
+        if self.cassette is not None and self.cassette.mode == "replay":
+            # The real session was never called, so extend its history ourselves
+            chat.history = [
+                *chat.history,
+                {"role": "user", "parts": [content]},
+                {"role": "model", "parts": [response.text]},
+            ]
+        return response
+
+    async def stream_message(self, chat, content, name="chat", **kwargs):
+        """Send a chat message and yield the response text chunk by chunk"""
+        if self.cassette is not None:
+            # Cassettes hold whole responses, so replay them as one chunk
+            response = await self.send_message(chat, content, name, **kwargs)
+            yield response.text
+            return
+
+        async for text in self.stream(name, chat.send_message, content, **kwargs):
+            yield text
+
+    async def stream_generate(self, name, contents, **kwargs):
+        """Generate a one-off response and yield its text chunk by chunk"""
+        if self.cassette is not None:
+            response = await self.generate(name, contents, **kwargs)
+            yield response.text
+            return
+
+        async for text in self.stream(name, self.get(name).generate_content, contents, **kwargs):
+            yield text
+
+    async def stream(self, name, fn, *args, **kwargs):
+        """Call ``fn(..., stream=True)`` in a worker thread and yield chunk text as it arrives"""
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        done = object()
+        stop = threading.Event()
+
+        def pump():
+            try:
+                for chunk in fn(*args, stream=True, **kwargs):
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+            except Exception as e:
+                loop.call_soon_threadsafe(chunks.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(chunks.put_nowait, done)
+
+        last = None
+        async with self.semaphore(name):
+            with upstream_timer("gemini", name):
+                worker = asyncio.ensure_future(self.in_thread(pump))
+                try:
+                    while (chunk := await chunks.get()) is not done:
+                        if isinstance(chunk, Exception):
+                            raise chunk
+                        last = chunk
+                        text = chunk_text(chunk)
+                        if text:
+                            yield text
+                finally:
+                    # Stop pulling if the consumer left early, and hold the slot until the thread is free
+                    stop.set()
+                    await worker
+        # Streamed responses report cumulative usage on the final chunk
+        if last is not None:
+            record_token_usage(self.spec(name)["model_name"], last)
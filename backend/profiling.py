@@ -0,0 +1,167 @@
+import asyncio
+import hmac
+import logging
+import os
+import random
+import re
+import uuid
+
+logger = logging.getLogger(__name__)
+
+TOKEN_HEADER = b"x-profile-token"
+REQUEST_ID_HEADER = b"x-request-id"
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+ARTIFACT_FORMATS = {
+    "html": ("html", "text/html"),
+    "speedscope": ("speedscope.json", "application/json"),
+}
+
+
+def header(scope, name):
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def token_matches(token, admin_token):
+    """Compare a presented token with the admin token in constant time"""
+    if not token or not admin_token:
+        return False
+    return hmac.compare_digest(token.encode(), admin_token.encode())
+
+
+class ProfileStore:
+    """Profile artifacts on local disk, keeping only the newest ``max_files``"""
+
+    def __init__(self, directory, max_files=50):
+        self.directory = directory
+        self.max_files = max_files
+
+    def path(self, request_id, fmt):
+        return os.path.join(self.directory, f"{request_id}.{ARTIFACT_FORMATS[fmt][0]}")
+
+    def save(self, request_id, profiler):
+        """Write the HTML report and speedscope flame graph for a stopped profiler"""
+        from pyinstrument.renderers import SpeedscopeRenderer
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path(request_id, "html"), "w") as f:
+            f.write(profiler.output_html())
+        with open(self.path(request_id, "speedscope"), "w") as f:
+            f.write(profiler.output(SpeedscopeRenderer()))
+        self.prune()
+
+    def list(self):
+        """Stored profile ids, newest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        reports = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".html")]
+        reports.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+        return [entry.name[:-len(".html")] for entry in reports]
+
+    def prune(self):
+        for request_id in self.list()[self.max_files:]:
+            for fmt in ARTIFACT_FORMATS:
+                try:
+                    os.remove(self.path(request_id, fmt))
+                except FileNotFoundError:
+                    pass
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that runs selected requests under a sampling profiler.
+
+    A request is profiled when it carries the admin token in X-Profile-Token
+    or is picked at ``sample_rate``; its profile is stored under the request
+    id, which is returned in X-Profile-ID. Other requests only pay for a
+    header lookup and a random draw.
+    """
+
+    def __init__(self, app, store, sample_rate=0.0, admin_token=None, interval=0.001):
+        self.app = app
+        self.store = store
+        self.sample_rate = sample_rate
+        self.admin_token = admin_token
+        self.interval = interval
+
+    def should_profile(self, scope):
+        if scope["type"] != "http" or scope["path"].startswith(("/profiles", "/metrics")):
+            return False
+        if token_matches(header(scope, TOKEN_HEADER), self.admin_token):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if not self.should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        from pyinstrument import Profiler
+
+        request_id = header(scope, REQUEST_ID_HEADER)
+        if not request_id or not REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-profile-id", request_id.encode())]
+            await send(message)
+
+        # async_mode attributes time spent awaiting (upstream calls, sleeps) to the awaiting frame
+        profiler = Profiler(interval=self.interval, async_mode="enabled")
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.stop()
+            try:
+                await asyncio.to_thread(self.store.save, request_id, profiler)
+                logger.info("Saved profile %s for %s %s", request_id, scope['method'], scope['path'])
+            except Exception as e:
+                logger.warning("Failed to save profile %s: %s", request_id, e)
+
+
+def install(app):
+    """Add opt-in request profiling and the /profiles download endpoints to an app.
+
+    Does nothing unless PROFILE_ADMIN_TOKEN or PROFILE_SAMPLE_RATE is set.
+    """
+    admin_token = os.getenv("PROFILE_ADMIN_TOKEN") or None
+    sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    if not admin_token and not sample_rate:
+        return None
+
+    from fastapi import Header, HTTPException
+    from fastapi.responses import FileResponse
+
+    store = ProfileStore(os.getenv("PROFILE_DIR", "profiles"), int(os.getenv("PROFILE_MAX_FILES", "50")))
+
+    def check_token(token):
+        if not token_matches(token, admin_token):
+            raise HTTPException(status_code=403, detail="Invalid or missing X-Profile-Token")
+
+    @app.get("/profiles", include_in_schema=False)
+    async def list_profiles(x_profile_token: str | None = Header(None)):
+        check_token(x_profile_token)
+        return {"profiles": store.list()}
+
+    @app.get("/profiles/{request_id}", include_in_schema=False)
+    async def download_profile(request_id: str, format: str = "html", x_profile_token: str | None = Header(None)):
+        check_token(x_profile_token)
+        if not REQUEST_ID_PATTERN.match(request_id) or format not in ARTIFACT_FORMATS:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        path = store.path(request_id, format)
+        if not os.path.exists(path):
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return FileResponse(path, media_type=ARTIFACT_FORMATS[format][1], filename=os.path.basename(path))
+
+    app.add_middleware(
+        ProfilingMiddleware,
+        store=store,
+        sample_rate=sample_rate,
+        admin_token=admin_token,
+        interval=float(os.getenv("PROFILE_INTERVAL", "0.001")),
+    )
+    return store
@@ -0,0 +1,291 @@
+import abc
+import asyncio
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, closing, contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class LockTimeout(TimeoutError):
+    """Raised when a named lock cannot be acquired in time"""
+
+
+# Deletes a lock only while it still holds our token, in one atomic step
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class StateBackend(abc.ABC):
+    """Key/value store for chat sessions, finalized histories and cached results.
+
+    Values are pickled, so anything the app already pickles (chat history
+    protos, result dicts) can be stored. ``ttl`` is in seconds. ``lock`` is a
+    named mutex that holds across every process sharing the backend.
+    Storage is opened on first use, or up front by ``open``.
+    """
+
+    async def open(self):
+        pass
+
+    @abc.abstractmethod
+    async def get(self, key):
+        ...
+
+    @abc.abstractmethod
+    async def set(self, key, value, ttl=None):
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, key):
+        ...
+
+    @abc.abstractmethod
+    def lock(self, name, timeout=60, lease=120):
+        """Async context manager holding the named lock; the lease expires after ``lease`` seconds"""
+
+    async def close(self):
+        pass
+
+
+class MemoryStateBackend(StateBackend):
+    """Per-process state; only consistent with a single worker"""
+
+    # Seconds between sweeps for expired entries
+    PURGE_INTERVAL = 300
+
+    def __init__(self):
+        self._data = {}
+        # name -> [lock, tasks holding or waiting for it]
+        self._locks = {}
+        self._last_purge = time.monotonic()
+
+    async def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.time():
+            del self._data[key]
+            return None
+        return pickle.loads(value)
+
+    async def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        self._data[key] = (pickle.dumps(value), expires_at)
+        if time.monotonic() - self._last_purge >= self.PURGE_INTERVAL:
+            self._purge()
+
+    def _purge(self):
+        now = time.time()
+        self._last_purge = time.monotonic()
+        for key in [key for key, (_, expires_at) in self._data.items() if expires_at is not None and expires_at <= now]:
+            del self._data[key]
+
+    async def delete(self, key):
+        self._data.pop(key, None)
+
+    @asynccontextmanager
+    async def lock(self, name, timeout=60, lease=120):
+        entry = self._locks.setdefault(name, [asyncio.Lock(), 0])
+        lock = entry[0]
+        entry[1] += 1
+        try:
+            try:
+                await asyncio.wait_for(lock.acquire(), timeout)
+            except asyncio.TimeoutError:
+                raise LockTimeout(f"Timed out waiting for lock {name}")
+            try:
+                yield
+            finally:
+                lock.release()
+        finally:
+            # Forget the lock once nobody holds or waits for it, so per-session names don't pile up
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[name]
+
+
+class SQLiteStateBackend(StateBackend):
+    """State in a local SQLite file, shared by every worker on the machine.
+
+    Expired rows are filtered out on read and deleted every ``PURGE_INTERVAL``
+    seconds by whichever write comes next.
+    """
+
+    POLL_INTERVAL = 0.05
+    PURGE_INTERVAL = 300
+
+    def __init__(self, path):
+        self.path = path
+        self._ready = False
+        self._setup_lock = threading.Lock()
+        self._last_purge = time.monotonic()
+
+    def _setup(self):
+        with self._setup_lock:
+            if self._ready:
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with closing(sqlite3.connect(self.path, timeout=30, isolation_level=None)) as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB, expires_at REAL)")
+                conn.execute("CREATE INDEX IF NOT EXISTS kv_expires_at ON kv (expires_at)")
+                conn.execute("CREATE TABLE IF NOT EXISTS locks (name TEXT PRIMARY KEY, token TEXT, expires_at REAL)")
+            self._ready = True
+
+    @contextmanager
+    def _connect(self):
+        """A connection that is rolled back on error and always closed"""
+        if not self._ready:
+            self._setup()
+        with closing(sqlite3.connect(self.path, timeout=30, isolation_level=None)) as conn:
+            with conn:
+                yield conn
+
+    async def open(self):
+        await asyncio.to_thread(self._setup)
+
+    def _get(self, key):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, time.time()),
+            ).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def _set(self, key, value, ttl):
+        expires_at = time.time() + ttl if ttl else None
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, pickle.dumps(value), expires_at),
+            )
+            if time.monotonic() - self._last_purge >= self.PURGE_INTERVAL:
+                self._purge(conn)
+
+    def _purge(self, conn):
+        now = time.time()
+        self._last_purge = time.monotonic()
+        purged = conn.execute("DELETE FROM kv WHERE expires_at <= ?", (now,)).rowcount
+        conn.execute("DELETE FROM locks WHERE expires_at <= ?", (now,))
+        if purged:
+            logger.info("Purged %d expired state entries", purged)
+
+    def _delete(self, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def _try_acquire(self, name, token, lease):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM locks WHERE name = ? AND expires_at <= ?", (name, now))
+            acquired = conn.execute(
+                "INSERT OR IGNORE INTO locks (name, token, expires_at) VALUES (?, ?, ?)",
+                (name, token, now + lease),
+            ).rowcount == 1
+            conn.execute("COMMIT")
+        return acquired
+
+    def _release(self, name, token):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM locks WHERE name = ? AND token = ?", (name, token))
+
+    async def get(self, key):
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key, value, ttl=None):
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+    async def delete(self, key):
+        await asyncio.to_thread(self._delete, key)
+
+    @asynccontextmanager
+    async def lock(self, name, timeout=60, lease=120):
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        while not await asyncio.to_thread(self._try_acquire, name, token, lease):
+            if time.monotonic() >= deadline:
+                raise LockTimeout(f"Timed out waiting for lock {name}")
+            await asyncio.sleep(self.POLL_INTERVAL)
+        try:
+            yield
+        finally:
+            await asyncio.to_thread(self._release, name, token)
+
+
+class RedisStateBackend(StateBackend):
+    """State in Redis or any server speaking its protocol, shared across machines"""
+
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, url, prefix="pathfinder:"):
+        self.url = url
+        self.prefix = prefix
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import redis.asyncio as redis
+
+            # RESP2 works with every Redis-compatible server, including ones without HELLO
+            self._client = redis.Redis.from_url(self.url, protocol=2)
+        return self._client
+
+    async def open(self):
+        await self.client.ping()
+
+    async def get(self, key):
+        value = await self.client.get(self.prefix + key)
+        return pickle.loads(value) if value is not None else None
+
+    async def set(self, key, value, ttl=None):
+        await self.client.set(self.prefix + key, pickle.dumps(value), px=int(ttl * 1000) if ttl else None)
+
+    async def delete(self, key):
+        await self.client.delete(self.prefix + key)
+
+    @asynccontextmanager
+    async def lock(self, name, timeout=60, lease=120):
+        key = f"{self.prefix}lock:{name}"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        while not await self.client.set(key, token, nx=True, px=int(lease * 1000)):
+            if time.monotonic() >= deadline:
+                raise LockTimeout(f"Timed out waiting for lock {name}")
+            await asyncio.sleep(self.POLL_INTERVAL)
+        try:
+            yield
+        finally:
+            # Only release our own lease; it may have expired and been taken over
+            await self.client.eval(RELEASE_LOCK_SCRIPT, 1, key, token)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+
+
+def create_state_backend():
+    """Build the backend selected by STATE_BACKEND (sqlite, memory or redis)"""
+    kind = os.getenv("STATE_BACKEND", "sqlite").lower()
+    if kind == "memory":
+        backend = MemoryStateBackend()
+    elif kind == "sqlite":
+        backend = SQLiteStateBackend(os.getenv("STATE_SQLITE_PATH", os.path.join("chat_history", "state.sqlite3")))
+    elif kind == "redis":
+        backend = RedisStateBackend(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    else:
+        raise ValueError(f"Unknown STATE_BACKEND: {kind}")
+    logger.info("Using %s state backend", kind)
+    return backend
@@ -0,0 +1,154 @@
+import asyncio
+
+import pytest
+
+from admission import DEFAULT_POLICIES, HIGH_PRIORITY, LOW_PRIORITY, AdmissionController, Overloaded
+
+CHEAP = "/cheap"
+HEAVY = "/heavy"
+
+
+def make_controller(max_in_flight=4, reserved=1, **heavy):
+    policies = {
+        CHEAP: {"priority": HIGH_PRIORITY, "limit": 4, "queue": 4, "max_wait": 1, "expected": 0.1},
+        HEAVY: {"priority": LOW_PRIORITY, "limit": 2, "queue": 2, "max_wait": 1, "expected": 0.1, **heavy},
+    }
+    return AdmissionController(policies, max_in_flight=max_in_flight, reserved=reserved)
+
+
+async def settle():
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def test_admits_under_limit_and_releases():
+    async def scenario():
+        controller = make_controller()
+        await controller.acquire(HEAVY)
+        await controller.acquire(HEAVY)
+        assert controller.in_flight[HEAVY] == 2
+        controller.release(HEAVY, 0.1)
+        controller.release(HEAVY, 0.1)
+        assert controller.total == 0
+
+    asyncio.run(scenario())
+
+
+def test_queued_request_starts_when_a_slot_frees():
+    async def scenario():
+        controller = make_controller()
+        await controller.acquire(HEAVY)
+        await controller.acquire(HEAVY)
+        waiter = asyncio.create_task(controller.acquire(HEAVY))
+        await settle()
+        assert controller.queued[HEAVY] == 1 and not waiter.done()
+
+        controller.release(HEAVY, 0.1)
+        await waiter
+        assert controller.queued[HEAVY] == 0
+        assert controller.in_flight[HEAVY] == 2
+
+    asyncio.run(scenario())
+
+
+def test_high_priority_is_admitted_before_earlier_low_priority():
+    async def scenario():
+        controller = make_controller(max_in_flight=2, reserved=1)
+        await controller.acquire(HEAVY)
+        heavy_waiter = asyncio.create_task(controller.acquire(HEAVY))
+        await settle()
+        # The reserved slot is still open to cheap requests
+        await controller.acquire(CHEAP)
+        cheap_waiter = asyncio.create_task(controller.acquire(CHEAP))
+        await settle()
+        assert not heavy_waiter.done() and not cheap_waiter.done()
+
+        controller.release(HEAVY, 0.1)
+        await settle()
+        assert cheap_waiter.done()
+        assert not heavy_waiter.done()
+
+        controller.release(CHEAP, 0.1)
+        controller.release(CHEAP, 0.1)
+        await heavy_waiter
+
+    asyncio.run(scenario())
+
+
+def test_sheds_when_queue_is_full():
+    async def scenario():
+        controller = make_controller()
+        await controller.acquire(HEAVY)
+        await controller.acquire(HEAVY)
+        waiters = [asyncio.create_task(controller.acquire(HEAVY)) for _ in range(2)]
+        await settle()
+        with pytest.raises(Overloaded) as error:
+            await controller.acquire(HEAVY)
+        assert error.value.reason == "queue_full"
+        assert error.value.retry_after > 0
+        for waiter in waiters:
+            waiter.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_sheds_on_wait_estimate():
+    async def scenario():
+        controller = make_controller(expected=5)
+        await controller.acquire(HEAVY)
+        await controller.acquire(HEAVY)
+        with pytest.raises(Overloaded) as error:
+            await controller.acquire(HEAVY)
+        assert error.value.reason == "wait_estimate"
+        assert controller.queued[HEAVY] == 0
+
+    asyncio.run(scenario())
+
+
+def test_sheds_after_max_wait():
+    async def scenario():
+        controller = make_controller(max_wait=0.05)
+        await controller.acquire(HEAVY)
+        await controller.acquire(HEAVY)
+        with pytest.raises(Overloaded) as error:
+            await controller.acquire(HEAVY)
+        assert error.value.reason == "timeout"
+        assert controller.queued[HEAVY] == 0
+        assert controller.in_flight[HEAVY] == 2
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        controller = make_controller()
+        await controller.acquire(HEAVY)
+        await controller.acquire(HEAVY)
+        waiter = asyncio.create_task(controller.acquire(HEAVY))
+        await settle()
+        waiter.cancel()
+        await settle()
+        assert controller.queued[HEAVY] == 0
+
+        controller.release(HEAVY, 0.1)
+        assert controller.in_flight[HEAVY] == 1
+
+    asyncio.run(scenario())
+
+
+def test_wait_estimate_counts_in_flight_and_queued_requests():
+    controller = make_controller(expected=2)
+    assert controller.estimated_wait(HEAVY) == 1
+    controller.in_flight[HEAVY] = 2
+    controller.queued[HEAVY] = 2
+    assert controller.estimated_wait(HEAVY) == 3
+
+
+@pytest.mark.parametrize("path", sorted(DEFAULT_POLICIES))
+def test_default_queues_fill_before_wait_estimate_sheds(path):
+    policy = DEFAULT_POLICIES[path]
+    controller = AdmissionController({path: policy})
+    controller.in_flight[path] = policy["limit"]
+    controller.queued[path] = max(0, policy["queue"] - 1)
+    if policy["queue"]:
+        assert controller.estimated_wait(path) <= policy["max_wait"]
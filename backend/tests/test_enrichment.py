@@ -0,0 +1,123 @@
+import asyncio
+import socket
+
+import httpx
+import pytest
+
+import enrichment
+from enrichment import (
+    BlockedAddress,
+    PageSummaryParser,
+    fetch_page_summary,
+    is_public_address,
+    public_only_transport,
+    resolve_public_addresses,
+)
+
+PAGE = b"""<html><head><title>Acme  Scheduling</title>
+<meta name="description" content="Book   appointments online.">
+</head><body><h1>Fast booking</h1><h2>For &amp; salons</h2><p>ignored</p></body></html>"""
+
+
+@pytest.mark.parametrize("address", ["8.8.8.8", "2606:4700:4700::1111", "::ffff:8.8.8.8"])
+def test_public_addresses(address):
+    assert is_public_address(address)
+
+
+@pytest.mark.parametrize("address", [
+    "127.0.0.1", "10.0.0.5", "172.16.0.1", "192.168.1.1", "169.254.169.254",
+    "0.0.0.0", "::1", "fe80::1", "fc00::1", "::ffff:127.0.0.1", "224.0.0.1",
+])
+def test_non_public_addresses(address):
+    assert not is_public_address(address)
+
+
+def fake_resolver(monkeypatch, answers):
+    async def getaddrinfo(self, host, port, **kwargs):
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (address, port)) for address in answers[host]]
+
+    monkeypatch.setattr(asyncio.BaseEventLoop, "getaddrinfo", getaddrinfo)
+
+
+def test_resolve_public_addresses(monkeypatch):
+    fake_resolver(monkeypatch, {"public.test": ["8.8.8.8", "8.8.4.4"], "mixed.test": ["8.8.8.8", "10.0.0.1"]})
+
+    async def scenario():
+        assert await resolve_public_addresses("public.test", 80) == ["8.8.8.8", "8.8.4.4"]
+        assert await resolve_public_addresses("1.1.1.1", 80) == ["1.1.1.1"]
+        with pytest.raises(BlockedAddress):
+            await resolve_public_addresses("mixed.test", 80)
+        with pytest.raises(BlockedAddress):
+            await resolve_public_addresses("169.254.169.254", 80)
+
+    asyncio.run(scenario())
+
+
+def test_page_summary_parser_collects_title_description_and_headings():
+    parser = PageSummaryParser()
+    for i in range(0, len(PAGE), 7):
+        parser.feed(PAGE[i:i + 7].decode())
+    assert parser.summary() == {
+        "title": "Acme Scheduling",
+        "description": "Book appointments online.",
+        "headings": ["Fast booking", "For & salons"],
+    }
+    assert not parser.done
+
+
+def test_page_summary_parser_stops_after_enough_headings():
+    parser = PageSummaryParser()
+    parser.feed("".join(f"<h2>Feature {i}</h2>" for i in range(20)))
+    assert parser.done
+    assert len(parser.summary()["headings"]) == PageSummaryParser.MAX_HEADINGS
+
+
+async def serve_page(requests):
+    async def handle(reader, writer):
+        head = await reader.readuntil(b"\r\n\r\n")
+        requests.append(head.decode())
+        writer.write(
+            b"HTTP/1.1 200 OK\r\ncontent-type: text/html; charset=utf-8\r\n"
+            + f"content-length: {len(PAGE)}\r\nconnection: close\r\n\r\n".encode()
+            + PAGE
+        )
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def test_public_only_transport_refuses_private_hosts():
+    async def scenario():
+        requests = []
+        server, port = await serve_page(requests)
+        async with server, httpx.AsyncClient(transport=public_only_transport()) as client:
+            with pytest.raises(BlockedAddress):
+                await fetch_page_summary(client, f"http://127.0.0.1:{port}/", 4096)
+        return requests
+
+    assert asyncio.run(scenario()) == []
+
+
+def test_public_only_transport_connects_to_the_checked_address(monkeypatch):
+    resolved = []
+
+    async def resolve(host, port):
+        # Stands in for a public answer; a second lookup could rebind elsewhere
+        resolved.append(host)
+        return ["127.0.0.1"]
+
+    monkeypatch.setattr(enrichment, "resolve_public_addresses", resolve)
+
+    async def scenario():
+        requests = []
+        server, port = await serve_page(requests)
+        async with server, httpx.AsyncClient(transport=public_only_transport()) as client:
+            summary = await fetch_page_summary(client, f"http://rebind.test:{port}/", 4096)
+        return summary, requests, port
+
+    summary, requests, port = asyncio.run(scenario())
+    assert summary["title"] == "Acme Scheduling"
+    assert resolved == ["rebind.test"]
+    assert f"host: rebind.test:{port}" in requests[0].lower()
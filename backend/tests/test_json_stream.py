@@ -0,0 +1,89 @@
+import json
+import random
+
+import pytest
+
+from json_stream import JsonFieldParser
+
+MVP = {
+    "main_response": "Build a booking page first, with \"quotes\", {braces} and [brackets] in text.",
+    "mermaid": "graph TD;\n  A-->B;",
+    "steps": [{"name": "auth", "tags": ["a", "b"]}, {"name": "calendar"}],
+    "escaped": "back\\slash \\\" and unicode é",
+    "count": 3,
+    "empty": {},
+    "flag": None,
+}
+
+
+def feed_chunks(text, sizes):
+    parser = JsonFieldParser()
+    fields = []
+    pos = 0
+    for size in sizes:
+        fields.extend(parser.feed(text[pos:pos + size]))
+        pos += size
+    fields.extend(parser.feed(text[pos:]))
+    return parser, fields
+
+
+def test_whole_object_yields_fields_in_order():
+    parser, fields = feed_chunks(json.dumps(MVP), [])
+    assert fields == list(MVP.items())
+    assert parser.done
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_random_chunking_matches_json_loads(seed):
+    rng = random.Random(seed)
+    text = json.dumps(MVP, indent=rng.choice([None, 2]))
+    sizes = [rng.randint(1, 12) for _ in range(len(text))]
+    parser, fields = feed_chunks(text, sizes)
+    assert dict(fields) == json.loads(text)
+    assert parser.done
+
+
+def test_one_character_at_a_time():
+    text = json.dumps(MVP)
+    parser, fields = feed_chunks(text, [1] * len(text))
+    assert fields == list(MVP.items())
+
+
+def test_field_is_returned_once_its_terminator_arrives():
+    parser = JsonFieldParser()
+    assert parser.feed('{"a": "x", "b": [1, ') == [("a", "x")]
+    assert parser.feed('2]') == []
+    assert parser.feed('}') == [("b", [1, 2])]
+    assert parser.done
+
+
+def test_incomplete_object_is_not_done():
+    parser = JsonFieldParser()
+    parser.feed('{"a": 1, "b": {"c": ')
+    assert not parser.done
+
+
+def test_text_after_the_object_is_ignored():
+    parser = JsonFieldParser()
+    assert parser.feed('{"a": 1}\n{"b": 2}') == [("a", 1)]
+    assert parser.done
+
+
+def test_empty_object():
+    parser = JsonFieldParser()
+    assert parser.feed("{}") == []
+    assert parser.done
+
+
+def test_top_level_array_is_rejected():
+    parser = JsonFieldParser()
+    with pytest.raises(ValueError):
+        parser.feed("[1, 2]")
+    assert not parser.done
+
+
+def test_top_level_array_split_across_chunks_is_rejected():
+    parser = JsonFieldParser()
+    assert parser.feed("  ") == []
+    with pytest.raises(ValueError):
+        parser.feed('[{"a": 1}]')
@@ -0,0 +1,47 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from model_registry import ModelRegistry
+
+SPECS = {"stub": {"model_name": "stub-model", "max_concurrency": 1}}
+
+
+def stub_stream(pulled, count=20):
+    def fn(prompt, stream=False):
+        for i in range(count):
+            time.sleep(0.01)
+            pulled.append(i)
+            yield SimpleNamespace(text=f"{prompt}{i} ", usage_metadata=None)
+
+    return fn
+
+
+def test_stream_yields_every_chunk():
+    async def scenario():
+        registry = ModelRegistry(SPECS)
+        pulled = []
+        texts = [text async for text in registry.stream("stub", stub_stream(pulled, 3), "c")]
+        registry.close()
+        return texts
+
+    assert asyncio.run(scenario()) == ["c0 ", "c1 ", "c2 "]
+
+
+def test_abandoned_stream_stops_upstream_before_freeing_its_slot():
+    async def scenario():
+        registry = ModelRegistry(SPECS)
+        pulled = []
+        stream = registry.stream("stub", stub_stream(pulled), "c")
+        assert await anext(stream) == "c0 "
+        await stream.aclose()
+
+        assert not registry.semaphore("stub").locked()
+        pulled_at_close = len(pulled)
+        await asyncio.sleep(0.1)
+        registry.close()
+        return pulled_at_close, len(pulled)
+
+    pulled_at_close, pulled_later = asyncio.run(scenario())
+    assert pulled_at_close < 20
+    assert pulled_later == pulled_at_close
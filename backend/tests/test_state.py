@@ -0,0 +1,155 @@
+import asyncio
+import sqlite3
+from contextlib import asynccontextmanager, closing
+
+import pytest
+
+from bench.fake_redis import FakeRedis, create_server
+from state import LockTimeout, MemoryStateBackend, RedisStateBackend, SQLiteStateBackend
+
+KINDS = ["memory", "sqlite", "redis"]
+
+
+@asynccontextmanager
+async def open_backend(kind, tmp_path):
+    server = None
+    if kind == "memory":
+        backend = MemoryStateBackend()
+    elif kind == "sqlite":
+        backend = SQLiteStateBackend(str(tmp_path / "state.sqlite3"))
+    else:
+        server = await create_server(FakeRedis(), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        backend = RedisStateBackend(f"redis://127.0.0.1:{port}/0")
+    await backend.open()
+    try:
+        yield backend
+    finally:
+        await backend.close()
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+
+
+@pytest.mark.parametrize("kind", KINDS)
+def test_get_set_delete(kind, tmp_path):
+    async def scenario():
+        async with open_backend(kind, tmp_path) as backend:
+            assert await backend.get("missing") is None
+            await backend.set("result", {"score": 7, "tags": ["a"]})
+            assert await backend.get("result") == {"score": 7, "tags": ["a"]}
+            await backend.set("result", "replaced")
+            assert await backend.get("result") == "replaced"
+            await backend.delete("result")
+            assert await backend.get("result") is None
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("kind", KINDS)
+def test_sub_second_ttl_expires(kind, tmp_path):
+    async def scenario():
+        async with open_backend(kind, tmp_path) as backend:
+            await backend.set("short", 1, ttl=0.2)
+            await backend.set("long", 2, ttl=60)
+            assert await backend.get("short") == 1
+            await asyncio.sleep(0.3)
+            assert await backend.get("short") is None
+            assert await backend.get("long") == 2
+
+    asyncio.run(scenario())
+
+
+def test_memory_purge_removes_expired_entries():
+    async def scenario():
+        backend = MemoryStateBackend()
+        backend.PURGE_INTERVAL = 0
+        await backend.set("expired", 1, ttl=0.05)
+        await asyncio.sleep(0.1)
+        await backend.set("fresh", 2, ttl=60)
+        return backend._data
+
+    assert set(asyncio.run(scenario())) == {"fresh"}
+
+
+def test_sqlite_purge_removes_expired_rows(tmp_path):
+    path = tmp_path / "state.sqlite3"
+
+    async def scenario():
+        backend = SQLiteStateBackend(str(path))
+        backend.PURGE_INTERVAL = 0
+        await backend.set("expired", 1, ttl=0.05)
+        async with backend.lock("stale", lease=0.05):
+            pass
+        await asyncio.sleep(0.1)
+        await backend.set("fresh", 2, ttl=60)
+
+    asyncio.run(scenario())
+    with closing(sqlite3.connect(path)) as conn:
+        assert [row[0] for row in conn.execute("SELECT key FROM kv")] == ["fresh"]
+        assert conn.execute("SELECT COUNT(*) FROM locks").fetchone()[0] == 0
+
+
+@pytest.mark.parametrize("kind", KINDS)
+def test_lock_is_mutually_exclusive(kind, tmp_path):
+    async def scenario():
+        async with open_backend(kind, tmp_path) as backend:
+            holders = 0
+            most = 0
+
+            async def hold():
+                nonlocal holders, most
+                async with backend.lock("chat:a", timeout=5):
+                    holders += 1
+                    most = max(most, holders)
+                    await asyncio.sleep(0.02)
+                    holders -= 1
+
+            await asyncio.gather(*(hold() for _ in range(4)))
+            return most
+
+    assert asyncio.run(scenario()) == 1
+
+
+@pytest.mark.parametrize("kind", KINDS)
+def test_lock_times_out(kind, tmp_path):
+    async def scenario():
+        async with open_backend(kind, tmp_path) as backend:
+            async with backend.lock("chat:a"):
+                with pytest.raises(LockTimeout):
+                    async with backend.lock("chat:a", timeout=0.1):
+                        pass
+            # Free again once released
+            async with backend.lock("chat:a", timeout=0.1):
+                pass
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("kind", ["sqlite", "redis"])
+def test_expired_lease_is_taken_over_and_not_released_by_old_holder(kind, tmp_path):
+    async def scenario():
+        async with open_backend(kind, tmp_path) as backend:
+            async with backend.lock("chat:a", lease=0.1):
+                await asyncio.sleep(0.2)
+                # The lease ran out, so another holder may take the lock
+                taker = backend.lock("chat:a", timeout=1, lease=60)
+                await taker.__aenter__()
+            # Leaving the first block must not release the new holder's lock
+            with pytest.raises(LockTimeout):
+                async with backend.lock("chat:a", timeout=0.1):
+                    pass
+            await taker.__aexit__(None, None, None)
+
+    asyncio.run(scenario())
+
+
+def test_memory_locks_are_forgotten_when_free():
+    async def scenario():
+        backend = MemoryStateBackend()
+        for i in range(100):
+            async with backend.lock(f"chat:{i}"):
+                pass
+        return backend._locks
+
+    assert asyncio.run(scenario()) == {}